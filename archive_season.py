@@ -0,0 +1,57 @@
+"""Moves closed season orders, transactions, snapshots and histories to the archive tables"""
+import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
+import datetime as DT
+
+from web import db, app
+from services import ArchiveService, ArchiveError
+
+app.app_context().push()
+
+ROOT = os.path.dirname(__file__)
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hcs:b:")
+    except getopt.GetoptError:
+        print('archive_season.py -h')
+        sys.exit(2)
+    season = None
+    before = None
+    check = False
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Archive closed season")
+            print("  -s <season>  season to archive, must be before the current season")
+            print("  -b <YYYY-MM-DD>  histories created before the date are archived, defaults to the next season start")
+            print("  -c  only count the rows to archive")
+            sys.exit(0)
+        if opt == '-s':
+            season = int(arg)
+        if opt == '-b':
+            before = DT.datetime.strptime(arg, "%Y-%m-%d")
+        if opt == '-c':
+            check = True
+
+    if season is None:
+        print("Season missing, use -s <season>")
+        sys.exit(2)
+
+    try:
+        if check:
+            counts = ArchiveService.counts(season, before)
+        else:
+            counts = ArchiveService.archive_season(season, before)
+    except ArchiveError as exc:
+        print(exc)
+        sys.exit(1)
+
+    for table, rows in counts.items():
+        print(f"{table}: {rows}")
+    print(f"Season {season}: {sum(counts.values())} row(s)" + (" to archive" if check else " archived"))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,3 +2,4 @@
 from .api import Agent
 from .match import is_concede
 from .rebblnet_api import REBBL_API
+from .replay import Recorder
@@ -1,11 +1,16 @@
 """BB2 api agent modul"""
 import requests
 
+from .stream import iter_items
+
 class Agent:
     """BB2 api agent"""
     BASE_URL = "http://web.cyanide-studio.com/ws/bb2/"
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=None, http=None):
+        """`base_url` and `http` (requests compatible, e.g. bb2.replay.Recorder) allow offline runs"""
         self.api_key = api_key
+        self.base_url = base_url or self.__class__.BASE_URL
+        self.http = http or requests
 
     def team(self, name):
         """Pulls team data"""
@@ -29,6 +34,43 @@ class Agent:
         """Pull matches"""
         if 'limit' not in kwargs:
             kwargs['limit'] = 10000
+        self.__matches_defaults(kwargs)
+        r = self.call("matches", **kwargs)
+        data = r.json()
+        return data
+
+    def matches_stream(self, page_size=500, record=None, **kwargs):
+        """Yields matches page by page, the next page starts at the start date of the last match
+
+        Each response is parsed incrementally so memory does not grow with the number of matches.
+        `record` maps the match dict to the record yielded, so callers keep only what they need.
+        """
+        self.__matches_defaults(kwargs)
+        kwargs['limit'] = page_size
+        # matches already yielded at the boundary date of the page
+        boundary = set()
+        while True:
+            count = 0
+            last_date = None
+            new_boundary = set()
+            for match in iter_items(self.call("matches", stream=True, **kwargs), 'matches.item'):
+                count += 1
+                uuid = match.get('uuid')
+                if uuid in boundary:
+                    continue
+                if match.get('started') != last_date:
+                    last_date = match.get('started')
+                    new_boundary = set()
+                new_boundary.add(uuid)
+                yield record(match) if record else match
+
+            # last page or all matches of the page started at the same time as the previous page
+            if count < page_size or last_date is None or last_date == kwargs['start']:
+                break
+            kwargs['start'] = last_date
+            boundary = new_boundary
+
+    def __matches_defaults(self, kwargs):
         if 'v' not in kwargs:
             kwargs['v'] = 1
         if 'exact' not in kwargs:
@@ -37,13 +79,10 @@ class Agent:
             kwargs['start'] = '2016-01-01'
         if 'league' not in kwargs:
             kwargs['league'] = 'REBBL Imperium,REBBL Imperium Extra,REBBL Imperium Extra 2'
-        r = self.call("matches", **kwargs)
-        data = r.json()
-        return data
 
-    def call(self, method, **kwargs):
-        """Call the api method with kwargs parameters"""
-        url = self.__class__.BASE_URL + method+"/"
+    def call(self, method, stream=False, **kwargs):
+        """Call the api method with kwargs parameters, `stream` defers download of the response body"""
+        url = self.base_url + method+"/"
         kwargs['key'] = self.api_key
         kwargs['order'] = 'CreationDate'
-        return requests.get(url=url, params=kwargs)
+        return self.http.get(url=url, params=kwargs, stream=stream)
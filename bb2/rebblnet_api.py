@@ -1,12 +1,24 @@
 """REBBL Net api agent modul"""
 import requests
 
+from .stream import iter_items
+
 class REBBL_API:
     """BB2 api agent"""
     BASE_URL = "https://rebbl.net/api/v2/"
-    
+
+    def __init__(self, base_url=None, http=None):
+        """`base_url` and `http` (requests compatible, e.g. bb2.replay.Recorder) allow offline runs"""
+        self.base_url = base_url or self.__class__.BASE_URL
+        self.http = http or requests
+
     def slim_round(self, league, season, round):
-        url = self.__class__.BASE_URL +"league/"+str(league)+"/"+str(season)+"/slim/"+str(round)
-        r = requests.get(url=url)
+        url = self.base_url +"league/"+str(league)+"/"+str(season)+"/slim/"+str(round)
+        r = self.http.get(url=url)
         data = r.json()
         return data
+
+    def slim_round_stream(self, league, season, round):
+        """Yields the matches of the round as they are parsed from the response"""
+        url = self.base_url +"league/"+str(league)+"/"+str(season)+"/slim/"+str(round)
+        return iter_items(self.http.get(url=url, stream=True))
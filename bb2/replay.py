@@ -0,0 +1,89 @@
+"""Record and replay of the API responses"""
+import os
+import io
+import json
+import hashlib
+from urllib.parse import urlparse, urlencode, unquote
+
+import requests
+
+# request parameters not stored in the fixtures
+SECRET_PARAMS = ["key"]
+
+def fixture_key(url, params=None):
+    """Returns fixture key of the request, independent of the host so fixtures can be served locally"""
+    params = sorted((k, str(v)) for k, v in (params or {}).items() if k not in SECRET_PARAMS)
+    request = unquote(urlparse(url).path) + "?" + urlencode(params)
+    return hashlib.sha1(request.encode("utf-8")).hexdigest()
+
+class FixtureResponse:
+    """Minimal requests.Response stand-in for the replayed fixtures"""
+    def __init__(self, status_code, content, headers=None, url=""):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.url = url
+        self.raw = io.BytesIO(content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i+chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+    def close(self):
+        pass
+
+class Recorder:
+    """Drop in replacement of `requests` for the API agents
+
+    In *record* mode calls the API and stores every response in `directory`,
+    in *replay* mode serves the stored responses without network access.
+    """
+    def __init__(self, directory, mode="replay"):
+        if mode not in ["record", "replay"]:
+            raise ValueError(f"Unknown mode {mode}, use record or replay")
+        self.directory = directory
+        self.mode = mode
+
+    def fixture_file(self, url, params=None):
+        return os.path.join(self.directory, fixture_key(url, params) + ".json")
+
+    def save(self, url, params, response):
+        os.makedirs(self.directory, exist_ok=True)
+        fixture = {
+            "url": unquote(urlparse(url).path),
+            "params": {k: str(v) for k, v in (params or {}).items() if k not in SECRET_PARAMS},
+            "status_code": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+            "body": response.content.decode("utf-8"),
+        }
+        with open(self.fixture_file(url, params), "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+
+    @classmethod
+    def load(cls, fixture_file):
+        with open(fixture_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, url, params=None, **kwargs):
+        if self.mode == "record":
+            response = requests.get(url, params=params, **kwargs)
+            self.save(url, params, response)
+            # the body has been read already, streaming callers read it from the copy
+            return FixtureResponse(response.status_code, response.content, response.headers, url)
+
+        try:
+            fixture = self.load(self.fixture_file(url, params))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No fixture recorded for {url} {params}")
+        return FixtureResponse(fixture["status_code"], fixture["body"].encode("utf-8"), fixture["headers"], url)
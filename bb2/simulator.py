@@ -0,0 +1,136 @@
+"""Local HTTP stand-in for the REBBL and BB2 APIs serving recorded fixtures
+
+Usage: python -m bb2.simulator -d <fixtures> [-p <port>] [-l <latency ms>] [-e <429 rate>]
+Point the agents base_url to http://localhost:<port>/<original path>.
+"""
+import os, sys, getopt
+import time
+import json
+import random
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+
+from .replay import Recorder, fixture_key
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """Serves fixture matching the request path and parameters"""
+    # set by serve()
+    directory = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    retry_after = 1000
+    stats = {"requests": 0, "served": 0, "missing": 0, "rate_limited": 0}
+    lock = threading.Lock()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def send(self, status_code, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.count("requests")
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self.count("rate_limited")
+            self.send(429, json.dumps({"message": "Too Many Requests", "retry_after": self.retry_after}),
+                      headers={"Retry-After": str(max(1, self.retry_after // 1000))})
+            return
+
+        request = urlparse(self.path)
+        fixture_file = os.path.join(self.directory, fixture_key(request.path, dict(parse_qsl(request.query))) + ".json")
+        try:
+            fixture = Recorder.load(fixture_file)
+        except FileNotFoundError:
+            self.count("missing")
+            self.send(404, json.dumps({"message": f"No fixture for {self.path}"}))
+            return
+
+        self.count("served")
+        self.send(fixture["status_code"], fixture["body"], fixture["headers"].get("Content-Type", "application/json"))
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(directory, port=8000, latency=0, jitter=0, error_rate=0.0, retry_after=1000):
+    """Returns running simulator server, latency and jitter are in ms, error_rate is share of 429 responses"""
+    handler = type("Handler", (SimulatorHandler,), {
+        "directory": directory,
+        "latency": latency / 1000,
+        "jitter": jitter / 1000,
+        "error_rate": error_rate,
+        "retry_after": retry_after,
+        "stats": {"requests": 0, "served": 0, "missing": 0, "rate_limited": 0},
+    })
+    server = ThreadingHTTPServer(("localhost", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hd:p:l:j:e:r:")
+    except getopt.GetoptError:
+        print('python -m bb2.simulator -h')
+        sys.exit(2)
+    directory = None
+    port = 8000
+    latency = 0
+    jitter = 0
+    error_rate = 0.0
+    retry_after = 1000
+    for opt, arg in opts:
+        if opt == '-h':
+            print(__doc__)
+            print("  -d  fixtures directory recorded by bb2.replay.Recorder")
+            print("  -p  port, default 8000")
+            print("  -l  response latency in ms, default 0")
+            print("  -j  latency jitter in ms, default 0")
+            print("  -e  share of requests answered with 429, default 0.0")
+            print("  -r  retry_after in ms sent with 429, default 1000")
+            sys.exit(0)
+        if opt == '-d':
+            directory = arg
+        if opt == '-p':
+            port = int(arg)
+        if opt == '-l':
+            latency = int(arg)
+        if opt == '-j':
+            jitter = int(arg)
+        if opt == '-e':
+            error_rate = float(arg)
+        if opt == '-r':
+            retry_after = int(arg)
+
+    if not directory:
+        print("Fixtures directory is missing, see -h")
+        sys.exit(2)
+
+    server = serve(directory, port, latency, jitter, error_rate, retry_after)
+    print(f"Serving {directory} on http://localhost:{port}/")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(server.RequestHandlerClass.stats)
+        server.shutdown()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,16 @@
+"""Incremental parsing of the API responses"""
+
+def iter_items(response, prefix="item"):
+    """Yields the objects at `prefix` of the response body one by one, the body is never held whole
+
+    `response` must be requested with stream=True, it is closed once the items are read.
+    """
+    import ijson
+
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        for item in ijson.items(response.raw, prefix):
+            yield item
+    finally:
+        response.close()
@@ -0,0 +1,79 @@
+"""Benchmarks the price ingest against the local sheet backend and a scratch DB"""
+import os, sys, getopt
+import time
+import random
+import tempfile
+os.environ.setdefault("DB_PROFILE", "batch")
+
+from web import db, app
+from models import engine
+from services import SheetService, StockService, StockNotificationService
+
+ROOT = os.path.dirname(__file__)
+
+HEADER = ['Team(Sorted A-Z)', 'Current Value', 'Code', 'Race', 'Coach', 'Region', 'Division']
+RACES = ["Human", "Orc", "Dwarf", "Skaven", "Lizardmen", "Wood Elf", "Dark Elf", "Undead", "Nurgle", "Chaos"]
+
+def generate_teams(count, seed):
+    """Returns sheet rows for `count` teams with random prices"""
+    rnd = random.Random(seed)
+    rows = [HEADER]
+    for i in range(count):
+        rows.append([
+            f"Team {i:05d}", round(rnd.uniform(50, 500), 7), f"T{i:05d}", rnd.choice(RACES),
+            f"Coach {i:05d}", "REL", f"Season 12 - Division {i % 5 + 1}{'ABCDEFGH'[i % 8]}"
+        ])
+    return rows
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"ht:r:d:")
+    except getopt.GetoptError:
+        print('bench_ingest.py -h')
+        sys.exit(2)
+    teams = 1000
+    runs = 3
+    directory = tempfile.mkdtemp(prefix="stock_bench_")
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Benchmark StockService.update with generated teams, never touches the configured DB or sheet")
+            print("bench_ingest.py [-t <teams>] [-r <runs>] [-d <dir>]")
+            print("  -t  number of teams, default 1000")
+            print("  -r  number of price update runs after the initial load, default 3")
+            print("  -d  directory for the scratch DB and the local sheets, default new temp dir")
+            sys.exit(0)
+        if opt == '-t':
+            teams = int(arg)
+        if opt == '-r':
+            runs = int(arg)
+        if opt == '-d':
+            directory = arg
+
+    # scratch sqlite DB and local sheets, must be set before the first DB access
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.abspath(directory), 'bench.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    engine.configure(app, "batch")
+    app.config['SHEET_BACKEND'] = "local"
+    app.config['SHEET_LOCAL_DIR'] = directory
+    app.app_context().push()
+    # price change notifications would go to discord
+    StockNotificationService.notificators = []
+    db.create_all()
+
+    backend = SheetService.backend()
+    print(f"Ingesting {teams} teams from {directory}")
+    for run in range(runs + 1):
+        backend.set_values(SheetService.MAIN_SHEET, generate_teams(teams, run))
+        duration = timed(StockService.update)
+        desc = "initial load" if run == 0 else f"price update {run}"
+        print(f"{desc:>16s}: {duration:8.3f} s, {teams/duration:10.1f} teams/s")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
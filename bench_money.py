@@ -0,0 +1,191 @@
+"""Benchmarks the fixed-point money arithmetic against the Decimal path"""
+import sys, getopt
+import time
+import random
+from decimal import Decimal, localcontext
+
+from misc.money import SCALE, to_fixed, to_decimal, shares_for, ratio, value_of
+
+def timed(func, repeat):
+    """Returns (best duration in milliseconds, result) of `func`"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        duration = (time.perf_counter() - start) * 1000
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+def populate(users, stocks, holdings, seed=0):
+    """Returns (prices, changes, cash, portfolios) as Decimals with 7 places like the DB returns them"""
+    rnd = random.Random(seed)
+    prices = [Decimal(rnd.randrange(0, 50000000000)).scaleb(-7) for i in range(stocks)]
+    changes = [Decimal(rnd.randrange(-5000000000, 5000000000)).scaleb(-7) for i in range(stocks)]
+    cash = [Decimal(rnd.randrange(0, 500000000000)).scaleb(-7) for i in range(users)]
+    portfolios = [
+        [(rnd.randrange(1, 100), rnd.randrange(stocks)) for j in range(holdings)] for i in range(users)
+    ]
+    return prices, changes, cash, portfolios
+
+class Column:
+    """Stands in for a mapped column, reads go through a descriptor like the ORM attributes"""
+    def __set_name__(self, owner, name):
+        self.key = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__[self.key]
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.key] = value
+
+class Priced:
+    """Stands in for a loaded Stock row with its fixed_price and fixed_change properties"""
+    unit_price = Column()
+    unit_price_change = Column()
+
+    def __init__(self, unit_price, unit_price_change):
+        self.unit_price = unit_price
+        self.unit_price_change = unit_price_change
+
+    @property
+    def fixed_price(self):
+        try:
+            return self._fixed_price
+        except AttributeError:
+            self._fixed_price = to_fixed(self.unit_price)
+            return self._fixed_price
+
+    @property
+    def fixed_change(self):
+        try:
+            return self._fixed_change
+        except AttributeError:
+            self._fixed_change = to_fixed(self.unit_price_change)
+            return self._fixed_change
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hu:s:k:r:")
+    except getopt.GetoptError:
+        print('bench_money.py -h')
+        sys.exit(2)
+    users = 1000
+    stocks = 500
+    holdings = 20
+    repeat = 5
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Benchmark fixed-point money against Decimal, no DB is used")
+            print("bench_money.py [-u <users>] [-s <stocks>] [-k <holdings per user>] [-r <repeat>]")
+            sys.exit(0)
+        if opt == '-u':
+            users = int(arg)
+        if opt == '-s':
+            stocks = int(arg)
+        if opt == '-k':
+            holdings = int(arg)
+        if opt == '-r':
+            repeat = int(arg)
+
+    prices, changes, cash, portfolios = populate(users, stocks, holdings)
+    # Stock.fixed_price converts each loaded price on first use
+    rows = [Priced(price, change) for price, change in zip(prices, changes)]
+    # amounts converted once, as PositionBook keeps them
+    fixed_prices = [to_fixed(price) for price in prices]
+    fixed_changes = [to_fixed(change) for change in changes]
+    fixed_cash = [to_fixed(amount) for amount in cash]
+
+    def decimal_balances():
+        # the path before fixed-point, StockService.update left prec at 14
+        with localcontext() as ctx:
+            ctx.prec = 14
+            balances = []
+            for amount, portfolio in zip(cash, portfolios):
+                total = Decimal('0.00')
+                for units, stock in portfolio:
+                    total += units * rows[stock].unit_price
+                balances.append(amount + total)
+            return balances
+
+    def fixed_balances():
+        return [
+            amount + to_decimal(value_of((units, rows[stock].fixed_price) for units, stock in portfolio))
+            for amount, portfolio in zip(cash, portfolios)
+        ]
+
+    def converted_balances():
+        return [
+            amount + value_of((units, fixed_prices[stock]) for units, stock in portfolio)
+            for amount, portfolio in zip(fixed_cash, portfolios)
+        ]
+
+    def decimal_settlement():
+        with localcontext() as ctx:
+            ctx.prec = 14
+            return [
+                (amount // rows[portfolio[0][1]].unit_price) * rows[portfolio[0][1]].unit_price if rows[portfolio[0][1]].unit_price else 0
+                for amount, portfolio in zip(cash, portfolios)
+            ]
+
+    def fixed_settlement():
+        settled = []
+        for amount, portfolio in zip(cash, portfolios):
+            price = rows[portfolio[0][1]].fixed_price
+            settled.append(to_decimal(shares_for(to_fixed(amount), price) * price))
+        return settled
+
+    def converted_settlement():
+        settled = []
+        for amount, portfolio in zip(fixed_cash, portfolios):
+            price = fixed_prices[portfolio[0][1]]
+            settled.append(shares_for(amount, price) * price)
+        return settled
+
+    def decimal_ranking():
+        with localcontext() as ctx:
+            ctx.prec = 14
+            keys = [0 if int(row.unit_price) == 0 else row.unit_price_change / (row.unit_price - row.unit_price_change) for row in rows]
+            return sorted(range(stocks), key=lambda i: keys[i], reverse=True)
+
+    def fixed_ranking():
+        keys = [
+            0 if row.fixed_price < SCALE else ratio(row.fixed_change, row.fixed_price - row.fixed_change)
+            for row in rows
+        ]
+        return sorted(range(stocks), key=lambda i: keys[i], reverse=True)
+
+    def converted_ranking():
+        keys = [
+            0 if price < SCALE else ratio(change, price - change)
+            for price, change in zip(fixed_prices, fixed_changes)
+        ]
+        return sorted(range(stocks), key=lambda i: keys[i], reverse=True)
+
+    def exact_balances():
+        with localcontext() as ctx:
+            ctx.prec = 40
+            return [amount + sum(units * prices[stock] for units, stock in portfolio) for amount, portfolio in zip(cash, portfolios)]
+
+    exact = exact_balances()
+    print(f"{users} users, {stocks} stocks, {holdings} holdings per user, best of {repeat}")
+    for desc, decimal_func, fixed_func, converted_func in [
+        ("balances", decimal_balances, fixed_balances, converted_balances),
+        ("settlement", decimal_settlement, fixed_settlement, converted_settlement),
+        ("pct ranking", decimal_ranking, fixed_ranking, converted_ranking),
+    ]:
+        decimal_time, decimal_result = timed(decimal_func, repeat)
+        fixed_time, fixed_result = timed(fixed_func, repeat)
+        converted_time, converted_result = timed(converted_func, repeat)
+        print(f"{desc:>12s}: Decimal {decimal_time:8.2f} ms, fixed cached {fixed_time:8.2f} ms ({decimal_time / fixed_time:5.2f}x), "
+              f"fixed preconverted {converted_time:8.2f} ms ({decimal_time / converted_time:5.2f}x)")
+        if desc == "balances":
+            decimal_errors = sum(1 for value, expected in zip(decimal_result, exact) if value != expected)
+            fixed_errors = sum(1 for value, expected in zip(fixed_result, exact) if value != expected)
+            print(f"{'':>12s}  balances off the exact value: Decimal {decimal_errors}, fixed {fixed_errors}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
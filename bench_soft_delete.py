@@ -0,0 +1,96 @@
+"""Benchmarks the soft delete lookups against a scratch DB"""
+import os, sys, getopt
+import time
+import random
+import tempfile
+from decimal import Decimal
+os.environ.setdefault("DB_PROFILE", "batch")
+
+from web import db, app
+from models import engine
+from models.data_models import User, Stock
+
+ROOT = os.path.dirname(__file__)
+
+def timed(func, count):
+    """Returns average duration of `func` in microseconds"""
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) / count * 1000000
+
+def populate(users, stocks):
+    """Creates `users` and `stocks`, every 4th is soft deleted"""
+    db.session.bulk_insert_mappings(User, [
+        {'name': f"user{i:06d}#{i % 10000:04d}", 'disc_id': 100000 + i, 'deleted': i % 4 == 0} for i in range(users)
+    ])
+    db.session.bulk_insert_mappings(Stock, [
+        {'name': f"Team {i:06d}", 'code': f"T{i:06d}", 'unit_price': Decimal(100), 'deleted': i % 4 == 0} for i in range(stocks)
+    ])
+    db.session.commit()
+
+def query_plan(query):
+    """Returns sqlite query plan of the `query`"""
+    statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in db.session.execute(f"EXPLAIN QUERY PLAN {statement}")]
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hu:s:n:d:")
+    except getopt.GetoptError:
+        print('bench_soft_delete.py -h')
+        sys.exit(2)
+    users = 10000
+    stocks = 2000
+    count = 2000
+    directory = tempfile.mkdtemp(prefix="stock_bench_")
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Benchmark the soft delete hot lookups, never touches the configured DB")
+            print("bench_soft_delete.py [-u <users>] [-s <stocks>] [-n <lookups>] [-d <dir>]")
+            sys.exit(0)
+        if opt == '-u':
+            users = int(arg)
+        if opt == '-s':
+            stocks = int(arg)
+        if opt == '-n':
+            count = int(arg)
+        if opt == '-d':
+            directory = arg
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.abspath(directory), 'bench.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    engine.configure(app, "batch")
+    app.app_context().push()
+    db.create_all()
+    populate(users, stocks)
+
+    rnd = random.Random(0)
+    disc_ids = [100000 + rnd.randrange(users) for i in range(count)]
+    codes = [f"t{rnd.randrange(stocks):06d}" for i in range(count)]
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.deleted == False).limit(100)]
+    # loads the users into the identity map
+    loaded = [User.query.get(user_id) for user_id in user_ids]
+
+    results = [
+        ("User.get_by_discord_id", timed(lambda i: User.get_by_discord_id(disc_ids[i]), count)),
+        ("User.get_by_discord_id deleted=True", timed(lambda i: User.get_by_discord_id(disc_ids[i], deleted=True), count)),
+        ("Stock.find_by_code", timed(lambda i: Stock.find_by_code(codes[i]), count)),
+        ("User.query.get identity map hit", timed(lambda i: User.query.get(user_ids[i % len(user_ids)]), count)),
+        ("User.query.with_deleted()._get", timed(lambda i: User.query.with_deleted()._get(user_ids[i % len(user_ids)]), count)),
+    ]
+    print(f"{users} users, {stocks} stocks, {count} lookups, {directory}")
+    for desc, duration in results:
+        print(f"{desc:>40s}: {duration:10.1f} us")
+
+    print("Query plans:")
+    for desc, query in [
+        ("User.get_by_discord_id", User.query.filter_by(disc_id=disc_ids[0])),
+        ("Stock.find_by_code", Stock.query.filter(db.func.lower(Stock.code) == codes[0].lower())),
+    ]:
+        print(f"  {desc}: {'; '.join(query_plan(query))}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
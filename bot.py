@@ -5,13 +5,16 @@ from logging.handlers import RotatingFileHandler
 import traceback
 import re
 import asyncio
+import io
+import time
 
 import discord
 from sqlalchemy import func, asc
 from sqlalchemy.orm.exc import MultipleResultsFound
 from web import db, app
+from models import engine
 
-from services import SheetService, StockService, UserService, OrderService, OrderError, MatchService, balance_graph
+from services import SheetService, StockService, UserService, OrderService, OrderError, PositionBook, OrderBookService, ArchiveService, PriceSeries, MatchService, balance_graph, stock_chart, chart_key, chart_cache
 from models.data_models import Stock, User, Order, Share, Transaction, TransactionError
 from misc.helpers import represents_int, is_number, current_round
 
@@ -58,6 +61,17 @@ async def on_message(message):
     finally:
         db.session.close()
 
+# (guild id, member id) -> mention, kept current by the member events
+MEMBER_MENTIONS = {}
+
+def in_app_context(func, *args):
+    """Runs `func` with its own app context and DB session, for DB reads done in an executor"""
+    with app.app_context():
+        return func(*args)
+
+def remember_member(member):
+    MEMBER_MENTIONS[(member.guild.id, member.id)] = member.mention
+
 @client.event
 async def on_ready():
     """loads custom emojis upon ready"""
@@ -65,6 +79,22 @@ async def on_ready():
     logger.info(client.user.name)
     logger.info(client.user.id)
     logger.info('------')
+    MEMBER_MENTIONS.clear()
+    for guild in client.guilds:
+        for member in guild.members:
+            remember_member(member)
+
+@client.event
+async def on_member_join(member):
+    remember_member(member)
+
+@client.event
+async def on_member_update(before, after):
+    remember_member(after)
+
+@client.event
+async def on_member_remove(member):
+    MEMBER_MENTIONS.pop((member.guild.id, member.id), None)
 
 class LongMessage:
     """Class to handle long message sending in chunks"""
@@ -151,6 +181,8 @@ class DiscordCommand:
                 await self.__run_gain()
             elif self.cmd.startswith('!rank'):
                 await self.__run_rank()
+            elif self.cmd.startswith('!stats'):
+                await self.__run_stats()
         except Exception as e:
             await self.transaction_error(e)
             #raising will not kill the discord bot but will cause it to log this to log as well
@@ -174,6 +206,7 @@ class DiscordCommand:
         msg += "!graph - graph users balance timeline \n"
         msg += "!points - list point leaderboard \n"
         msg += "!rank - show the past weekly ranks for user \n"
+        msg += "!stats - show season return, volatility and drawdown of user \n"
         msg += "```"
         return msg
     @classmethod
@@ -247,6 +280,17 @@ class DiscordCommand:
         msg += "```"
         return msg
 
+    @classmethod
+    def stats_help(cls):
+        """help message"""
+        msg = "```"
+        msg += "Show season statistics of the user\n"
+        msg += "USAGE:\n"
+        msg += "!stats [user]\n"
+        msg += "\t[user]: optional, your statistics if not provided\n"
+        msg += "```"
+        return msg
+
     @classmethod
     def points_help(cls):
         """help message"""
@@ -326,6 +370,10 @@ class DiscordCommand:
         msg += "\tloss%: stock with most relative loss\n"
         msg += "\tdetail: detailed stock info\n"
         msg += "\t<x>: find X top or bottom stocks, or X is stock code if detail is used\n"
+        msg += "!stock book <code>\n"
+        msg += "\tbook: pending buy and sell orders of the stock\n"
+        msg += "!stock chart <code>[;<code>...]\n"
+        msg += "\tchart: price chart of the current season, separate up to 8 codes by **;**\n"
         msg += "```"
         return msg
 
@@ -351,12 +399,7 @@ class DiscordCommand:
         return
 
     def user_mention(self, user):
-        member = discord.utils.get(self.message.guild.members, id=user.disc_id)
-        if member is None:
-            mention = user.name
-        else:
-            mention = member.mention
-        return  mention
+        return MEMBER_MENTIONS.get((self.message.guild.id, user.disc_id), user.name)
 
     # must me under 2000 chars
     async def trade_message(self, msg):
@@ -391,11 +434,7 @@ class DiscordCommand:
     # must me under 2000 chars
     async def bank_notification(self, msg, user):
         """Notifies coach about bank change"""
-        member = discord.utils.get(self.message.guild.members, id=user.disc_id)
-        if member is None:
-            mention = user.name
-        else:
-            mention = member.mention
+        mention = self.user_mention(user)
 
         channel = discord.utils.get(self.client.get_all_channels(), name='bank-notifications')
         await self.send_message(channel, [f"{mention}: "+msg])
@@ -459,17 +498,15 @@ class DiscordCommand:
         
         msg3 = []
         msg3.append(" ")
-        if user.orders:
+        orders = user.pending_orders()
+        if orders:
             msg3.append(f"**Outstanding Orders:**")
 
-        for order in user.orders:
-            if not order.processed and order.operation=="sell":
-                msg3.append(f"{order.id}. {order.desc()}")
+        sells = [f"{order.id}. {order.desc()}" for order in orders if order.operation=="sell"]
+        buys = [f"{order.id}. {order.desc()}" for order in orders if order.operation=="buy"]
+        msg3.extend(sells)
         msg3.append(" ")
-
-        for order in user.orders:
-            if not order.processed and order.operation=="buy":
-                msg3.append(f"{order.id}. {order.desc()}")
+        msg3.extend(buys)
         msg3.append(" ")
 
         msg3.append(" ")
@@ -495,11 +532,11 @@ class DiscordCommand:
             await self.reply(["Season has not started yet, come back later!"])
             return
             
-        if User.get_by_discord_id(self.message.author.id):
+        user = User.get_by_discord_id(self.message.author.id, deleted=True)
+        if user and not user.deleted:
             await self.reply([f"**{self.message.author.mention}** account exists already\n"])
             return
-        elif User.get_by_discord_id(self.message.author.id, deleted=True):
-            user =  User.get_by_discord_id(self.message.author.id, deleted=True)
+        elif user:
             user.activate()
         else:
             user = UserService.new_coach(self.message.author, self.message.author.id)
@@ -531,6 +568,44 @@ class DiscordCommand:
         fl = discord.File("tmp/balance.png", filename="balance.png")
         await self.message.channel.send(file=fl)
     
+    async def __run_stats(self):
+        if len(self.args) > 2:
+            await self.reply(["Incorrect number of arguments!!!", self.__class__.stats_help()])
+            return
+        if len(self.args) == 2:
+            user = await self.user_unique(self.args[1])
+            if user is None:
+                return
+        else:
+            user = User.get_by_discord_id(self.message.author.id)
+            if user is None:
+                await self.reply(
+                    [(f"User {self.message.author.mention} does not exist."
+                    "Use !newuser to create user first.")]
+                )
+                return
+
+        from services import Analytics
+        user_id = user.id
+        report = await asyncio.get_event_loop().run_in_executor(
+            None, in_app_context, lambda: Analytics.user_report(Analytics.cached(), user_id)
+        )
+        if report is None:
+            await self.reply([f"No season statistics for {user.short_name()} yet"])
+            return
+        position, row = report
+        msg = [
+            f"**{user.short_name()}** season statistics",
+            f"Position by return: {position}",
+            f"Balance: {round(row['balance'], 2)} {app.config['CREDITS']}",
+            f"Invested: {round(row['invested'], 2)} {app.config['CREDITS']}",
+            f"Return: {round(100*row['return'], 2)}%",
+            f"Weekly volatility: {round(100*row['volatility'], 2)}%",
+            f"Max drawdown: {round(100*row['drawdown'], 2)}%",
+            f"Points: {int(row['points'])}",
+        ]
+        await self.reply(msg)
+
     async def __run_rank(self):
         # require username argument
         if len(self.args) == 1:
@@ -610,6 +685,136 @@ class DiscordCommand:
 
             await self.short_reply(msg)
 
+        if self.args[0] == "!admindb":
+            status = engine.pool_status()
+            msg = [f"{key}: {value}" for key, value in status.items()]
+            await self.reply(msg, block=True)
+
+        if self.args[0] == "!adminbook":
+            if len(self.args) == 2 and self.args[1] not in ["verify", "rebuild"]:
+                await self.reply([f"Wrong parameter - only *verify* and *rebuild* are allowed"])
+                return
+            if len(self.args) == 2 and self.args[1] == "verify":
+                mismatched = OrderBookService.verify()
+                await self.short_reply(f"{len(mismatched)} order book(s) do not match the pending orders")
+                return
+            if len(self.args) == 2 and self.args[1] == "rebuild":
+                count = OrderBookService.rebuild()
+                db.session.commit()
+                await self.short_reply(f"{count} order book(s) rebuilt")
+                return
+            totals, books = OrderBookService.summary()
+            msg = [
+                f"Buy orders: {totals['buy_orders']} ({totals['buy_shares']} shares, {round(totals['buy_funds'], 2)} {app.config['CREDITS']}, {totals['buy_all']} for all funds)",
+                f"Sell orders: {totals['sell_orders']} ({totals['sell_shares']} shares, {totals['sell_all']} of all units)",
+                " ",
+                '{:5s} - {:25} {:>5s}{:>8s}{:>12s}{:>6s}{:>8s}'.format("Code", "Team Name", "Buy", "Shares", "Funds", "Sell", "Shares"),
+                78*"-",
+            ]
+            for book in books:
+                msg.append(
+                    '{:5s} - {:25} {:>5d}{:>8d}{:>12.2f}{:>6d}{:>8d}'.format(book.stock.code, book.stock.name, book.buy_orders, book.buy_shares, book.buy_funds, book.sell_orders, book.sell_shares)
+                )
+            await self.reply(msg, block=True)
+
+        if self.args[0] == "!adminarchive":
+            if len(self.args) == 1:
+                seasons = ArchiveService.seasons()
+                await self.short_reply(f"Archived seasons: {', '.join(str(season) for season in seasons) or 'none'}")
+                return
+            if len(self.args) != 2 or not represents_int(self.args[1]):
+                await self.reply([f"Wrong parameter - season number expected"])
+                return
+            season = int(self.args[1])
+            stats = ArchiveService.season_stats(season)
+            msg = [
+                f"Season {season}",
+                78*"-",
+                f"Orders: {stats['orders']} by {stats['traders']} trader(s)",
+                f"Bought for: {round(stats['bought'], 2)} {app.config['CREDITS']}",
+                f"Sold for: {round(stats['sold'], 2)} {app.config['CREDITS']}",
+                " ",
+                "[Most traded]",
+            ]
+            for stock, shares in stats['most_traded']:
+                msg.append('{:5s} - {:25} {:>8d}'.format(stock.code, stock.name, int(shares)))
+            msg.append(" ")
+            msg.append("[Final balances]")
+            for user, amount in ArchiveService.final_balances(season):
+                msg.append('{:32s}: {:>12.2f}'.format(user.short_name(), amount))
+            await self.reply(msg, block=True)
+
+        if self.args[0] == "!adminanalytics":
+            if len(self.args) < 2 or self.args[1] not in ["users", "divisions", "corr"]:
+                await self.reply([f"Wrong parameter - only *users [count]*, *divisions* and *corr <code>;<code>...* are allowed"])
+                return
+            from services import Analytics
+            data = await asyncio.get_event_loop().run_in_executor(None, in_app_context, Analytics.cached)
+            start = time.perf_counter()
+            if self.args[1] == "users":
+                limit = int(self.args[2]) if len(self.args) == 3 and represents_int(self.args[2]) else 20
+                frame = Analytics.users(data).head(limit)
+                msg = ['{:3s} {:25s} {:>11s}{:>9s}{:>8s}{:>10s}{:>7s}'.format("#", "Name", "Balance", "Return%", "Vol%", "Drawdown%", "Points")]
+                msg.append(78*"-")
+                for position, (user_id, row) in enumerate(frame.iterrows(), 1):
+                    msg.append(
+                        '{:<3d} {:25s} {:>11.2f}{:>9.2f}{:>8.2f}{:>10.2f}{:>7d}'.format(
+                            position, row['name'][:-5], row['balance'], 100*row['return'], 100*row['volatility'], 100*row['drawdown'], int(row['points'])
+                        )
+                    )
+            elif self.args[1] == "divisions":
+                frame = Analytics.divisions(data)
+                msg = ['{:20s} {:>6s}{:>10s}{:>10s}{:>9s}{:>9s}'.format("Division", "Stocks", "Mean%", "Median%", "Best%", "Worst%")]
+                msg.append(78*"-")
+                for division, row in frame.iterrows():
+                    msg.append(
+                        '{:20s} {:>6d}{:>10.2f}{:>10.2f}{:>9.2f}{:>9.2f}'.format(
+                            str(division)[:20], int(row['stocks']), 100*row['mean_change'], 100*row['median_change'], 100*row['best'], 100*row['worst']
+                        )
+                    )
+            else:
+                codes = [code.strip() for code in " ".join(self.args[2:]).split(";") if code.strip()]
+                if len(codes) < 2 or len(codes) > 8:
+                    await self.reply([f"Provide 2 to 8 stock codes separated by **;**"])
+                    return
+                frame = Analytics.correlations(data, codes)
+                msg = ['{:6s}'.format("") + "".join('{:>7s}'.format(code[:6]) for code in frame.columns)]
+                for code, row in frame.iterrows():
+                    msg.append('{:6s}'.format(code[:6]) + "".join('{:>7.2f}'.format(value) for value in row))
+            msg.append(" ")
+            msg.append(f"Loaded in {data.load_time:.3f}s, computed in {time.perf_counter() - start:.3f}s")
+            await self.reply(msg, block=True)
+
+        if self.args[0] == "!adminsimulate":
+            if len(self.args) > 3 or (len(self.args) > 1 and self.args[1] not in ["sheet", "db"]):
+                await self.reply([f"Wrong parameter - only *sheet* (default) or *db* prices with optional count are allowed"])
+                return
+            from services import SimulationService
+            await self.short_reply("Simulating...")
+            use_sheet = len(self.args) == 1 or self.args[1] == "sheet"
+            limit = int(self.args[2]) if len(self.args) == 3 and represents_int(self.args[2]) else 25
+
+            def simulate():
+                return SimulationService.simulate(SimulationService.sheet_prices() if use_sheet else None)
+            # sheet download and simulation would block the event loop
+            result = await asyncio.get_event_loop().run_in_executor(None, in_app_context, simulate)
+            msg = [
+                f"Week {result.week} simulation, nothing has been changed",
+                f"SELL orders: {result.orders['sell'][0]} succeeded, {result.orders['sell'][1]} failed",
+                f"BUY orders: {result.orders['buy'][0]} succeeded, {result.orders['buy'][1]} failed",
+                f"Price changes: {len(result.price_changes)} stock(s)",
+                " ",
+                '{:3s} {:25s} {:>11s}{:>11s}{:>11s}{:>7s}'.format("#", "Name", "Gain", "Balance", "Bank", "Points"),
+                78*"-",
+            ]
+            for sim in result.users[:limit]:
+                msg.append(
+                    '{:<3d} {:25s} {:>11.2f}{:>11.2f}{:>11.2f}{:>7d}'.format(sim.position, sim.user.short_name(), sim.gain, sim.balance, sim.cash, sim.points)
+                )
+            msg.append(" ")
+            msg.append(f"Simulated in {result.duration:.3f}s")
+            await self.reply(msg, block=True)
+
         if self.args[0] == "!adminlist":
             # require username argument
             if len(self.args) == 1:
@@ -761,6 +966,58 @@ class DiscordCommand:
             detail = False
             if len(self.args) < 2:
                 await self.reply(["Incorrect number of arguments!!!", self.__class__.stock_help()])
+            elif self.args[1] == "book":
+                if len(self.args) != 3:
+                    await self.reply(["Incorrect number of arguments!!!", self.__class__.stock_help()])
+                    return
+                try:
+                    stock = Stock.find_by_code(self.args[2])
+                except MultipleResultsFound as exc:
+                    await self.reply([f"{self.args[2]} is not unique stock code"])
+                    return
+                if not stock:
+                    await self.reply([f"Stock code **{self.args[2]}** not found!"])
+                    return
+                book = OrderBookService.book(stock)
+                msg = [
+                    f"{stock.code} - {stock.name}",
+                    78*"-",
+                    f"Buy orders: {book.buy_orders}",
+                    f"\tfor up to {book.buy_shares} shares",
+                    f"\tfor up to {round(book.buy_funds, 2)} {app.config['CREDITS']}",
+                    f"\tfor all available {app.config['CREDITS']}: {book.buy_all}",
+                    f"Sell orders: {book.sell_orders}",
+                    f"\tof up to {book.sell_shares} shares",
+                    f"\tof all units: {book.sell_all}",
+                ]
+                await self.reply(msg, block=True)
+            elif self.args[1] == "chart":
+                codes = [code.strip() for code in " ".join(self.args[2:]).split(";") if code.strip()]
+                if not codes or len(codes) > 8:
+                    await self.reply(["Incorrect number of arguments!!!", self.__class__.stock_help()])
+                    return
+                stocks = []
+                for code in codes:
+                    try:
+                        stock = Stock.find_by_code(code)
+                    except MultipleResultsFound as exc:
+                        await self.reply([f"{code} is not unique stock code"])
+                        return
+                    if not stock:
+                        await self.reply([f"Stock code **{code}** not found!"])
+                        return
+                    stocks.append(stock)
+
+                key = chart_key(stocks)
+                png = chart_cache.get(key)
+                if png is None:
+                    ranges = PriceSeries.ranges(stocks)
+                    labels = {stock.id: stock.code for stock in stocks}
+                    # rendering is CPU bound, the event loop keeps serving other commands
+                    png = await asyncio.get_event_loop().run_in_executor(None, stock_chart, ranges, labels)
+                    chart_cache.set(key, png)
+                fl = discord.File(io.BytesIO(png), filename="chart.png")
+                await self.message.channel.send(file=fl)
             else:
                 limit = 24
                 if self.args[1] in ["top", "bottom", "hot", "net", "gain", "loss", "gain%", "loss%"] and len(self.args) == 3 and represents_int(self.args[2]) and int(self.args[2]) > 0 and int(self.args[2]) <= limit:
@@ -864,7 +1121,7 @@ class DiscordCommand:
                         '{:20s}: {:<12s}{:<8s}{:<8s}{:<11s}'.format("Date","Unit Price","Change","Shares", "Net Worth")
                     )
                     msg.append(78*"-")
-                    for sh in stocks[0].histories:
+                    for sh in PriceSeries.current(stocks[0]):
                         msg.append(
                             '{:20s}: {:10.2f}{:8.2f}{:8d}{:11.2f}'.format(str(sh.date_created), sh.unit_price, sh.unit_price_change, sh.units, round(sh.units*sh.unit_price,2))
                         )
@@ -920,7 +1177,7 @@ class DiscordCommand:
             return
 
 
-        order = OrderService.create(user, stock, **order_dict)
+        order = OrderService.create(user, stock, book=PositionBook.load(user), **order_dict)
         await self.reply([f"Order **{order.id}** placed succesfully."," ",f"**{order.desc()}**"])
         return
 
@@ -943,12 +1200,17 @@ class DiscordCommand:
             await self.reply(["Incorrect number of arguments!!!", self.__class__.sell_help()])
             return
         if self.args[1] == "all":
-            if len(user.shares):
-                for share in user.shares:
-                    order = OrderService.create(user, share.stock, **order_dict)
-                    await self.reply([f"Order placed succesfully."," ",f"**{order.desc()}**"])
-            else:
+            book = PositionBook.load(user)
+            shares = [share for share in user.shares if book.available_units(share.stock)]
+            if not user.shares:
                 await self.reply([f"You do not own any shares"])
+            elif not shares:
+                await self.reply([f"All your shares are in outstanding sell orders already"])
+            else:
+                orders = OrderService.create_many(user, [(share.stock, dict(order_dict)) for share in shares], book=book)
+                msg = [f"{len(orders)} order(s) placed succesfully."," "]
+                msg.extend([f"**{order.id}. {order.desc()}**" for order in orders])
+                await self.reply(msg)
         else:
             try:
                 stock = Stock.find_by_code(self.args[1])
@@ -967,13 +1229,12 @@ class DiscordCommand:
                 else:
                     order_dict['sell_shares'] = int(self.args[2])
             
-            share = Share.query.join(Share.user, Share.stock).filter(User.id == user.id, Stock.id == stock.id).one_or_none()
-            
-            if not share:
+            book = PositionBook.load(user)
+            if not book.holdings.get(stock.id):
                 await self.reply([f"You do not own any shares of **{self.args[1]}** stock!"])
                 return
 
-            order = OrderService.create(user, stock, **order_dict)
+            order = OrderService.create(user, stock, book=book, **order_dict)
             await self.reply([f"Order **{order.id}** placed succesfully."," ",f"**{order.desc()}**"])
         return
 
@@ -996,12 +1257,11 @@ class DiscordCommand:
             return
 
         if self.args[1] == "all":
-            mgs = []
-            for order in user.orders:
-                if not order.processed:
-                    OrderService.cancel(order.id, user)
-                    mgs.append(f"Order ID {order.id} has been cancelled")
-            await self.reply(mgs)
+            ids = OrderService.cancel_many(user)
+            if ids:
+                await self.reply([f"Order ID(s) {', '.join(str(order_id) for order_id in ids)} have been cancelled"])
+            else:
+                await self.reply(["You do not have any outstanding orders"])
             return
         else:
             if OrderService.cancel(self.args[1], user):
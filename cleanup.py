@@ -3,7 +3,7 @@ from sqlalchemy.orm.attributes import flag_modified
 from web import db, create_app
 from models.data_models import User, Stock
 
-app = create_app()
+app = create_app("batch")
 app.app_context().push()
 
 for user in User.query.with_deleted().all():
@@ -1,5 +1,7 @@
 """Updates statistics and process achievements script"""
 import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
 from web import app
 from services import AdminNotificationService, OrderService
 
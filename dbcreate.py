@@ -1,4 +1,4 @@
 """creates db"""
 from web import db, create_app
 
-db.create_all(app=create_app())
+db.create_all(app=create_app("batch"))
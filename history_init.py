@@ -2,7 +2,7 @@
 from web import db, create_app
 from models.data_models import Stock, BalanceHistory, User
 
-app = create_app()
+app = create_app("batch")
 app.app_context().push()
 users = User.query.all()
 
@@ -0,0 +1,63 @@
+"""Reports query shapes recorded at runtime against the existing indexes"""
+import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
+from sqlalchemy import inspect
+
+from web import db, app
+from models import index_audit
+
+app.app_context().push()
+# the audit does not audit itself
+index_audit.disable()
+
+ROOT = os.path.dirname(__file__)
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hmcf:")
+    except getopt.GetoptError:
+        print('index_audit.py -h')
+        sys.exit(2)
+    path = app.config.get('DB_INDEX_AUDIT')
+    missing_only = False
+    clear = False
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Report query shapes recorded with DB_INDEX_AUDIT config against the indexes")
+            print("  -f <file>  shapes file, defaults to DB_INDEX_AUDIT config")
+            print("  -m  only shapes not fully covered by an index")
+            print("  -c  clear the recorded shapes after the report")
+            sys.exit(0)
+        if opt == '-f':
+            path = arg
+        if opt == '-m':
+            missing_only = True
+        if opt == '-c':
+            clear = True
+
+    if not path:
+        print("No shapes file, set DB_INDEX_AUDIT config or use -f")
+        sys.exit(2)
+
+    stored = index_audit.load(path)
+    report = index_audit.audit(inspect(db.engine), stored)
+    print('{:8s} {:>8s}  {:20s} {:40s} {}'.format("Status", "Count", "Table", "Where = | range | order by", "Best index"))
+    print(120*"-")
+    uncovered = 0
+    for table, equality, ranges, order_by, count, best, status in report:
+        if status != "covered":
+            uncovered += 1
+        elif missing_only:
+            continue
+        columns = f"{', '.join(equality)} | {', '.join(ranges)} | {', '.join(order_by)}"
+        print('{:8s} {:>8d}  {:20s} {:40s} {}'.format(status, count, table, columns, best or "-"))
+    print(f"{len(report)} shape(s), {uncovered} not covered by an index")
+
+    if clear:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: 036bc90a71db
+Revises: 0f82a99acef7
+Create Date: 2026-10-19 14:58:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '036bc90a71db'
+down_revision = '0f82a99acef7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    orders = sa.table('orders', sa.column('processed', sa.Boolean))
+    op.create_index('ix_orders_pending_operation', 'orders', ['processed', 'operation', 'date_created'], unique=False,
+                    postgresql_where=orders.c.processed == False, sqlite_where=orders.c.processed == False)
+    op.create_index('ix_orders_user_processed', 'orders', ['user_id', 'processed'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orders_user_processed', table_name='orders')
+    op.drop_index('ix_orders_pending_operation', table_name='orders')
@@ -0,0 +1,43 @@
+"""empty message
+
+Revision ID: 83cf90652ba2
+Revises: 01eac6e7ec7c
+Create Date: 2026-10-19 12:05:33.840761
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '83cf90652ba2'
+down_revision = '01eac6e7ec7c'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_users_active_disc_id', 'users', ['disc_id', 'deleted']),
+    ('ix_users_active_name', 'users', ['name', 'deleted']),
+    ('ix_stocks_active_code', 'stocks', ['code', 'deleted']),
+    ('ix_stocks_active_name', 'stocks', ['name', 'deleted']),
+]
+
+
+def upgrade():
+    for table_name in ['users', 'stocks']:
+        table = sa.table(table_name, sa.column('deleted', sa.Boolean))
+        op.execute(table.update().where(table.c.deleted == None).values(deleted=False))
+        op.alter_column(table_name, 'deleted', existing_type=sa.Boolean(), nullable=False)
+
+    for name, table_name, columns in INDEXES:
+        table = sa.table(table_name, sa.column('deleted', sa.Boolean))
+        op.create_index(name, table_name, columns, unique=False,
+                        postgresql_where=table.c.deleted == False, sqlite_where=table.c.deleted == False)
+
+
+def downgrade():
+    for name, table_name, columns in INDEXES:
+        op.drop_index(name, table_name=table_name)
+
+    for table_name in ['users', 'stocks']:
+        op.alter_column(table_name, 'deleted', existing_type=sa.Boolean(), nullable=True)
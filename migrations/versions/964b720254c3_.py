@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: 964b720254c3
+Revises: 97d4e7221460
+Create Date: 2026-10-19 18:22:41.730215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '964b720254c3'
+down_revision = '97d4e7221460'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # find_by_code compares lower(code), a plain code index cannot serve it
+    table = sa.table('stocks', sa.column('code', sa.String), sa.column('deleted', sa.Boolean))
+    op.drop_index('ix_stocks_active_code', table_name='stocks')
+    op.create_index('ix_stocks_active_code', 'stocks', [sa.func.lower(table.c.code), 'deleted'], unique=False,
+                    postgresql_where=table.c.deleted == False, sqlite_where=table.c.deleted == False)
+
+
+def downgrade():
+    table = sa.table('stocks', sa.column('deleted', sa.Boolean))
+    op.drop_index('ix_stocks_active_code', table_name='stocks')
+    op.create_index('ix_stocks_active_code', 'stocks', ['code', 'deleted'], unique=False,
+                    postgresql_where=table.c.deleted == False, sqlite_where=table.c.deleted == False)
@@ -0,0 +1,35 @@
+"""empty message
+
+Revision ID: ab353c808c8c
+Revises: b5372b4122c4
+Create Date: 2026-10-19 17:04:26.318852
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab353c808c8c'
+down_revision = 'b5372b4122c4'
+branch_labels = None
+depends_on = None
+
+TABLES = ['transactions', 'archived_transactions']
+
+
+def upgrade():
+    # existing prices were truncated to integers when stored, they are kept as they are
+    for table_name in TABLES:
+        op.alter_column(table_name, 'price',
+                   existing_type=sa.Integer(),
+                   type_=sa.Numeric(precision=14, scale=7),
+                   existing_nullable=False)
+
+
+def downgrade():
+    for table_name in TABLES:
+        op.alter_column(table_name, 'price',
+                   existing_type=sa.Numeric(precision=14, scale=7),
+                   type_=sa.Integer(),
+                   existing_nullable=False)
@@ -0,0 +1,55 @@
+"""Fixed-point money, amounts are integers scaled by SCALE
+
+Amounts enter with to_fixed, rounded half even to the 7 decimal places of the Numeric(14,7)
+columns, and leave with to_decimal. Sums and unit multiples are exact integers, divisions
+round explicitly: floor for share counts, half even for ratios.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from functools import lru_cache
+
+PLACES = 7
+SCALE = 10 ** PLACES
+QUANTUM = Decimal(1).scaleb(-PLACES)
+
+def to_fixed(value):
+    """Returns scaled integer of Decimal, int, float or str `value`, None stays None"""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value * SCALE
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return _decimal_to_fixed(value)
+
+# prices repeat across holdings, conversions are cached
+@lru_cache(maxsize=8192)
+def _decimal_to_fixed(value):
+    scaled = value * SCALE
+    fixed = int(scaled)
+    # values from the Numeric(14,7) columns need no rounding
+    if fixed == scaled:
+        return fixed
+    return int(value.quantize(QUANTUM, rounding=ROUND_HALF_EVEN).scaleb(PLACES))
+
+def to_decimal(fixed):
+    """Returns Decimal with 7 places of the scaled integer `fixed`"""
+    return Decimal(fixed).scaleb(-PLACES)
+
+def shares_for(funds, price):
+    """Returns whole shares of `price` the `funds` can buy, rounded down"""
+    return funds // price if price > 0 else 0
+
+def ratio(numerator, denominator):
+    """Returns scaled `numerator` / `denominator` rounded half even, 0 if `denominator` is 0"""
+    if not denominator:
+        return 0
+    quotient, remainder = divmod(numerator * SCALE, denominator)
+    # divmod floors, remainder has the sign of the denominator
+    twice = 2 * abs(remainder)
+    if twice > abs(denominator) or (twice == abs(denominator) and quotient % 2):
+        quotient += 1
+    return quotient
+
+def value_of(holdings):
+    """Returns scaled value of (units, fixed price) pairs"""
+    return sum(units * price for units, price in holdings)
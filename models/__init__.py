@@ -1 +1,2 @@
-from .data_models import *
\ No newline at end of file
+from .data_models import *
+from .archive_models import *
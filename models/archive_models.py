@@ -0,0 +1,76 @@
+"""Closed season rows moved out of the hot tables by ArchiveService
+
+Archived rows keep their original ids and dates, they are written by INSERT ... SELECT only
+and the ORM refuses to change them.
+"""
+from sqlalchemy import event
+from .base_model import db, Base
+
+class ArchivedOrder(Base):
+    __tablename__ = 'archived_orders'
+    season = db.Column(db.Integer, nullable=False, index=True)
+    week = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(80), nullable=False)
+    buy_funds = db.Column(db.Numeric(14,7), nullable=True)
+    buy_shares = db.Column(db.Integer, nullable=True)
+    sell_shares = db.Column(db.Integer, nullable=True)
+    final_price = db.Column(db.Numeric(14,7), nullable=True)
+    final_shares = db.Column(db.Integer, nullable=True)
+    share_price = db.Column(db.Numeric(14,7), nullable=True)
+    stock_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.String(255), nullable=False, default="")
+    processed = db.Column(db.Boolean, default=False, nullable=False)
+    result = db.Column(db.String(255), nullable=True)
+    success = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_archived_orders_season_user', season, user_id),
+        db.Index('ix_archived_orders_season_stock', season, stock_id),
+    )
+
+class ArchivedTransaction(Base):
+    __tablename__ = 'archived_transactions'
+    season = db.Column(db.Integer, nullable=False, index=True)
+    date_confirmed = db.Column(db.DateTime, nullable=True)
+    order_id = db.Column(db.Integer, nullable=True, index=True)
+    price = db.Column(db.Numeric(14,7), default=0, nullable=False)
+    balance = db.Column(db.Numeric(14,7), nullable=True)
+    confirmed = db.Column(db.Boolean, default=False, nullable=False)
+    description = db.Column(db.String(255), nullable=False)
+    account_id = db.Column(db.Integer, nullable=True, index=True)
+
+class ArchivedAccountSnapshot(Base):
+    __tablename__ = 'archived_account_snapshots'
+    season = db.Column(db.Integer, nullable=False, index=True)
+    amount = db.Column(db.Numeric(14,7), nullable=False)
+    week = db.Column(db.Integer, nullable=False)
+    account_id = db.Column(db.Integer, nullable=True, index=True)
+
+class ArchivedBalanceHistory(Base):
+    __tablename__ = 'archived_balance_histories'
+    season = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Numeric(14,7), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_archived_balance_histories_season_user', season, user_id), )
+
+class ArchivedStockHistory(Base):
+    __tablename__ = 'archived_stock_histories'
+    season = db.Column(db.Integer, nullable=False, index=True)
+    stock_id = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Numeric(14,7), nullable=False)
+    unit_price_change = db.Column(db.Numeric(14,7), nullable=False, default=0.0)
+    units = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_archived_stock_histories_season_stock', season, stock_id), )
+
+ARCHIVE_MODELS = (ArchivedOrder, ArchivedTransaction, ArchivedAccountSnapshot, ArchivedBalanceHistory, ArchivedStockHistory)
+
+@event.listens_for(db.session, 'before_flush')
+def protect_archive(session, flush_context, instances):
+    """archive is read only for the ORM"""
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, ARCHIVE_MODELS):
+            raise TypeError(f"{instance.__class__.__name__} is read only")
@@ -15,6 +15,62 @@ class Base(db.Model):
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    @classmethod
+    def upsert(cls, rows, index_elements, update_columns):
+        """Inserts `rows` dicts in one statement, rows conflicting on `index_elements` get `update_columns` updated"""
+        if not rows:
+            return
+        table = cls.__table__
+        dialect = db.session.get_bind(mapper=cls.__mapper__).dialect.name
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).values(rows)
+            update = {col: stmt.inserted[col] for col in update_columns}
+            update['date_modified'] = db.func.current_timestamp()
+            stmt = stmt.on_duplicate_key_update(update)
+        elif dialect in ["postgresql", "sqlite"]:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).values(rows)
+            update = {col: stmt.excluded[col] for col in update_columns}
+            update['date_modified'] = db.func.current_timestamp()
+            stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=update)
+        else:
+            cls.upsert_by_select(rows, index_elements, update_columns)
+            return
+        db.session.execute(stmt)
+
+    @classmethod
+    def upsert_by_select(cls, rows, index_elements, update_columns):
+        """Upsert of dialects without an upsert statement, existing keys are selected first
+
+        Existing rows are updated and the rest inserted in two executemany statements, concurrent
+        inserts of the same keys are not detected, the unique constraint still rejects them.
+        """
+        table = cls.__table__
+        key_columns = [table.c[col] for col in index_elements]
+        keys = [tuple(row[col] for col in index_elements) for row in rows]
+        # IN per key column selects a superset of the keys, tuple IN is not portable
+        candidates = db.session.query(*key_columns).filter(
+            db.and_(*[column.in_({key[i] for key in keys}) for i, column in enumerate(key_columns)])
+        )
+        existing = {tuple(row) for row in candidates}
+
+        updates = [row for row, key in zip(rows, keys) if key in existing]
+        inserts = [row for row, key in zip(rows, keys) if key not in existing]
+        if updates:
+            stmt = table.update() \
+                .where(db.and_(*[column == db.bindparam(f"key_{column.name}") for column in key_columns])) \
+                .values({**{col: db.bindparam(f"value_{col}") for col in update_columns}, 'date_modified': db.func.current_timestamp()})
+            db.session.execute(stmt, [
+                {**{f"key_{col}": row[col] for col in index_elements}, **{f"value_{col}": row[col] for col in update_columns}}
+                for row in updates
+            ])
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+
 
 class QueryWithSoftDelete(BaseQuery):
     _with_deleted = False
@@ -38,8 +94,13 @@ class QueryWithSoftDelete(BaseQuery):
         # this calls the original query.get function from the base class
         return super(QueryWithSoftDelete, self).get(*args, **kwargs)
 
-    def get(self, *args, **kwargs):
-        # the query.get method does not like it if there is a filter clause
-        # pre-loaded, so we need to implement it using a workaround
-        obj = self.with_deleted()._get(*args, **kwargs)
+    def get(self, ident):
+        # instance already in the session is returned without SQL
+        mapper = self._mapper_zero()
+        key = mapper.identity_key_from_primary_key(ident if isinstance(ident, (list, tuple)) else [ident])
+        obj = self.session.identity_map.get(key)
+        if obj is None or db.inspect(obj).expired:
+            # the query.get method does not like it if there is a filter clause
+            # pre-loaded, so we need to implement it using a workaround
+            obj = self.with_deleted()._get(ident)
         return obj if obj is None or self._with_deleted or not obj.deleted else None
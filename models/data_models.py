@@ -1,6 +1,7 @@
-from sqlalchemy import or_, UniqueConstraint, desc
+from sqlalchemy import or_, UniqueConstraint, desc, event
 from .base_model import db, Base, QueryWithSoftDelete
 from misc.helpers import current_round
+from misc.money import SCALE, to_fixed, to_decimal, ratio, value_of
 import logging
 import json
 import datetime
@@ -13,13 +14,14 @@ ROOT = os.path.dirname(__file__)
 
 logger = logging.getLogger('transaction')
 logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename=os.path.join(ROOT, '../logs/transaction.log'), encoding='utf-8', mode='a')
+# log files are opened on the first record, not on import
+handler = logging.FileHandler(filename=os.path.join(ROOT, '../logs/transaction.log'), encoding='utf-8', mode='a', delay=True)
 handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
 logger.addHandler(handler)
 
 db_logger = logging.getLogger("DB logging")
 db_logger.setLevel(logging.INFO)
-handler = RotatingFileHandler(os.path.join(ROOT, '../logs/db.log'), maxBytes=10000000, backupCount=5, encoding='utf-8', mode='a')
+handler = RotatingFileHandler(os.path.join(ROOT, '../logs/db.log'), maxBytes=10000000, backupCount=5, encoding='utf-8', mode='a', delay=True)
 handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
 db_logger.addHandler(handler)
 
@@ -30,7 +32,13 @@ class User(Base):
     name = db.Column(db.String(80), unique=True, nullable=False, index=True)
     accounts = db.relationship('Account', backref=db.backref('user', lazy=True), cascade="all, delete-orphan")
     point_cards = db.relationship('PointCard', backref=db.backref('user', lazy=True), cascade="all, delete-orphan")
-    deleted = db.Column(db.Boolean(), default=False)
+    deleted = db.Column(db.Boolean(), default=False, nullable=False)
+
+    # partial indexes on the active users where supported, composite elsewhere
+    __table_args__ = (
+        db.Index('ix_users_active_disc_id', disc_id, deleted, postgresql_where=deleted == False, sqlite_where=deleted == False),
+        db.Index('ix_users_active_name', name, deleted, postgresql_where=deleted == False, sqlite_where=deleted == False),
+    )
 
     query_class = QueryWithSoftDelete
 
@@ -43,6 +51,10 @@ class User(Base):
     def point_card(self):
         return next((card for card in self.point_cards if card.active), None)
 
+    def pending_orders(self):
+        """Returns unprocessed orders, oldest first"""
+        return Order.query.filter(Order.user_id == self.id, Order.processed == False).order_by(Order.date_created).all()
+
     def __init__(self,name="",disc_id=0):
         self.name = name
         self.disc_id = disc_id
@@ -53,21 +65,14 @@ class User(Base):
         return '<User %r>' % self.name
 
     def shares_value(self):
-        return sum([share.units * share.stock.unit_price for share in self.shares])
+        return to_decimal(value_of((share.units, share.stock.fixed_price) for share in self.shares))
         
     def balance(self):
-        total_value = Decimal('0.00')
-        for share in self.shares:
-            total_value += share.units * share.stock.unit_price
-        balance = self.account().amount + total_value
-        return balance
+        # Decimal sums of 7 place values are exact, only the share value is converted back
+        return self.account().amount + to_decimal(value_of((share.units, share.stock.fixed_price) for share in self.shares))
 
     def points(self):
-        total_value = 0
-        for record in self.point_card().records:
-            total_value += record.amount
-
-        return total_value
+        return self.point_card().points_total
 
     def current_gain(self):
         app = db.get_app()
@@ -123,30 +128,29 @@ class User(Base):
     def mention(self):
         return f'<@{self.disc_id}>'
 
-    def make_transaction(self,transaction):
-        # do nothing
-        if self.account().amount < transaction.price:
-            raise TransactionError("Insuficient Funds")
-        if transaction.confirmed:
-            raise TransactionError("Double processing of transaction")
+    def make_transaction(self, transaction, commit=True):
+        """Posts `transaction` to the account ledger, the caller commits if not `commit`
 
-        try:
-            self.account().amount = Account.amount - transaction.price
-            transaction.confirm()
-            self.account().transactions.append(transaction)
+        Raises TransactionError if it was posted already or the funds are insufficient.
+        """
+        self.account().post([transaction])
+        if commit:
             db.session.commit()
-        except Exception as e:
-            raise TransactionError(str(e))
-        else:
-            logger.info(f"{self.name}: {transaction.description} for {transaction.price}")
-
         return transaction
 
     def award_points(self, points = 0, reason = ""):
+        card = self.point_card()
+        if card.id is None:
+            db.session.flush()
+        # added through the session, appending would touch the eager loaded card.records
         record = PointRecord()
+        record.card_id = card.id
         record.amount = points
         record.reason = reason
-        self.point_card().records.append(record)
+        db.session.add(record)
+        # the increment is applied in SQL by the flush, a second award before it would replace it
+        card.points_total = PointCard.points_total + points
+        db.session.flush()
 
     def record_position(self, position=1):
         app = db.get_app()
@@ -205,7 +209,11 @@ class StockHistory(Base):
     unit_price_change = db.Column(db.Numeric(14,7), nullable=False, default = 0.0)
     units = db.Column(db.Integer, nullable=False)
 
-    stock = db.relationship('Stock', backref=db.backref('histories', lazy=False, cascade="all, delete-orphan"), lazy=True)
+    # price series reads of a stock
+    __table_args__ = (db.Index('ix_stock_histories_stock_date', stock_id, 'date_created'), )
+
+    # histories are never loaded with the stock, see Stock.latest_history and services.PriceSeries
+    stock = db.relationship('Stock', foreign_keys=[stock_id], backref=db.backref('histories', lazy=True, cascade="all, delete-orphan", order_by="StockHistory.id"), lazy=True)
 
 class Stock(Base):
     __tablename__ = 'stocks'
@@ -218,13 +226,28 @@ class Stock(Base):
     unit_price_change = db.Column(db.Numeric(14,7), nullable=False, default = 0.0)
     orders = db.relationship('Order', backref=db.backref('stock', lazy=False), cascade="save-update",lazy=True)
 
-    deleted = db.Column(db.Boolean(), default=False)
+    deleted = db.Column(db.Boolean(), default=False, nullable=False)
+    # newest StockHistory, set whenever a history is added
+    latest_history_id = db.Column(db.Integer, nullable=True)
+    latest_history = db.relationship('StockHistory', primaryjoin="foreign(Stock.latest_history_id) == StockHistory.id", uselist=False, post_update=True, lazy=True)
+
+    # partial indexes on the active stocks where supported, composite elsewhere
+    __table_args__ = (
+        # codes are matched case insensitively by find_by_code
+        db.Index('ix_stocks_active_code', db.func.lower(code), deleted, postgresql_where=deleted == False, sqlite_where=deleted == False),
+        db.Index('ix_stocks_active_name', name, deleted, postgresql_where=deleted == False, sqlite_where=deleted == False),
+    )
 
     query_class = QueryWithSoftDelete
 
     def last_history(self):
-        last_history = None if len(self.histories) == 0 else self.histories[-1]
-        return last_history
+        return self.latest_history
+
+    def add_history(self, history):
+        """Adds new `history` and makes it the latest one"""
+        history.stock = self
+        db.session.add(history)
+        self.latest_history = history
     
     def change_units_by(self,units):
         last_history = self.last_history()
@@ -274,7 +297,7 @@ class Stock(Base):
     def find_gain_pct(cls,limit=10):
         stocks =  cls.query.all()
         stocks = cls.add_share_data(stocks)
-        sort = sorted(stocks,key=lambda x: 0 if int(x.unit_price) == 0 else x.unit_price_change / (x.unit_price - x.unit_price_change), reverse=True)
+        sort = sorted(stocks,key=cls.change_pct_key, reverse=True)
         return sort[0:int(limit)]
 
     @classmethod
@@ -288,24 +311,61 @@ class Stock(Base):
     def find_loss_pct(cls,limit=10):
         stocks =  cls.query.all()
         stocks = cls.add_share_data(stocks)
-        sort = sorted(stocks,key=lambda x: 0 if int(x.unit_price) == 0 else x.unit_price_change / (x.unit_price - x.unit_price_change))
+        sort = sorted(stocks,key=cls.change_pct_key)
         return sort[0:int(limit)]
 
     @classmethod
     def find_by_code(cls,name):
-        stock = cls.query.filter(cls.code.ilike(f'{name}')).one_or_none()
+        stock = cls.query.filter(db.func.lower(cls.code) == name.lower()).one_or_none()
         if stock:
-            stock.share_count = sum(share.units for share in stock.shares)
-            stock.net_worth = stock.share_count * stock.unit_price
+            cls.add_share_data([stock])
         return stock
 
     @classmethod
     def add_share_data(cls, stocks):
         for stock in stocks:
             stock.share_count = sum(share.units for share in stock.shares)
-            stock.net_worth = stock.share_count * stock.unit_price
+            stock.net_worth = to_decimal(stock.share_count * stock.fixed_price)
         return stocks
 
+    @staticmethod
+    def change_pct_key(stock):
+        """Scaled relative change of the price, 0 for stocks with price under 1"""
+        price = stock.fixed_price
+        if price < SCALE:
+            return 0
+        change = stock.fixed_change
+        return ratio(change, price - change)
+
+    # prices are converted once per loaded value, the stock is shared by all its holders in the session
+    @property
+    def fixed_price(self):
+        try:
+            return self._fixed_price
+        except AttributeError:
+            self._fixed_price = to_fixed(self.unit_price)
+            return self._fixed_price
+
+    @property
+    def fixed_change(self):
+        try:
+            return self._fixed_change
+        except AttributeError:
+            self._fixed_change = to_fixed(self.unit_price_change)
+            return self._fixed_change
+
+@event.listens_for(Stock, 'expire')
+@event.listens_for(Stock, 'refresh')
+def clear_fixed_prices(stock, *args):
+    """fixed prices are converted again after the prices are expired or reloaded"""
+    stock.__dict__.pop('_fixed_price', None)
+    stock.__dict__.pop('_fixed_change', None)
+
+@event.listens_for(Stock.unit_price, 'set')
+@event.listens_for(Stock.unit_price_change, 'set')
+def price_changed(stock, value, oldvalue, initiator):
+    clear_fixed_prices(stock)
+
 class Share(Base):
     __tablename__ = 'shares'
 
@@ -340,6 +400,16 @@ class Order(Base):
     season = db.Column(db.Integer, nullable=False, default=12, index = True)
     week = db.Column(db.Integer, nullable=False, index = True)
 
+    __table_args__ = (
+        # pending orders of a stock, used by the order book aggregation
+        db.Index('ix_orders_stock_processed_operation', stock_id, processed, operation),
+        # processing queue, partial index on the unprocessed orders where supported, composite elsewhere
+        db.Index('ix_orders_pending_operation', processed, operation, 'date_created',
+                 postgresql_where=processed == False, sqlite_where=processed == False),
+        # outstanding orders of a user
+        db.Index('ix_orders_user_processed', user_id, processed),
+    )
+
     transaction = db.relationship('Transaction',uselist=False, backref=db.backref('order', lazy=True), cascade="all, delete-orphan",lazy=False)
 
     def desc(self):
@@ -358,6 +428,33 @@ class Order(Base):
                 desc = f"Sell all units of {self.stock.code} ({self.stock.name})"
         return desc
 
+class OrderBook(Base):
+    """Pending orders aggregate of a stock, maintained by OrderBookService"""
+    __tablename__ = 'order_books'
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False, unique=True)
+    buy_orders = db.Column(db.Integer, nullable=False, default=0)
+    # shares of the share limited buy orders
+    buy_shares = db.Column(db.Integer, nullable=False, default=0)
+    # funds of the funds limited buy orders
+    buy_funds = db.Column(db.Numeric(14,7), nullable=False, default=0)
+    # buy orders for all available funds
+    buy_all = db.Column(db.Integer, nullable=False, default=0)
+    sell_orders = db.Column(db.Integer, nullable=False, default=0)
+    # shares of the share limited sell orders
+    sell_shares = db.Column(db.Integer, nullable=False, default=0)
+    # sell orders of all owned units
+    sell_all = db.Column(db.Integer, nullable=False, default=0)
+
+    stock = db.relationship('Stock', backref=db.backref('order_book', uselist=False, lazy=True), lazy=False)
+
+    COUNTERS = ['buy_orders', 'buy_shares', 'buy_funds', 'buy_all', 'sell_orders', 'sell_shares', 'sell_all']
+
+    def __repr__(self):
+        return '<OrderBook %r>' % self.stock_id
+
+    def total_orders(self):
+        return self.buy_orders + self.sell_orders
+
 class Account(Base):
     __tablename__ = 'accounts'
     __table_args__ = (db.UniqueConstraint('user_id', 'season'), )
@@ -367,7 +464,8 @@ class Account(Base):
     active = db.Column(db.Boolean, default=True, nullable=False)
     season = db.Column(db.Integer, nullable=False, default=12, index = True)
 
-    transactions = db.relationship('Transaction', backref=db.backref('account', lazy=False), cascade="all, delete-orphan",lazy=False)
+    # the ledger grows with every trade, it is queried and never loaded with the account
+    transactions = db.relationship('Transaction', backref=db.backref('account', lazy=True), cascade="all, delete-orphan", lazy='dynamic')
 
     def __init__(self):
         app = db.get_app()
@@ -381,6 +479,37 @@ class Account(Base):
     def reset(self):
         self.amount = self.__class__.INIT_CASH
 
+    def post(self, transactions):
+        """Appends `transactions` to the ledger with their running balances, returns the new amount
+
+        The account row is locked and read once for the whole list, the ledger rows are inserted
+        with the next flush and never updated. Nothing is posted if any of them fails.
+        Transactions refer to their order by order_id, they join the session here with their balance.
+        """
+        for transaction in transactions:
+            if transaction.confirmed:
+                raise TransactionError("Double processing of transaction")
+            if transaction in db.session:
+                raise TransactionError("Transaction is in the session before its balance is set")
+        if self.id is None:
+            db.session.flush()
+        amount = to_fixed(db.session.query(Account.amount).filter(Account.id == self.id).with_for_update().scalar())
+        balances = []
+        for transaction in transactions:
+            price = to_fixed(transaction.price)
+            if amount < price:
+                raise TransactionError("Insuficient Funds")
+            amount -= price
+            balances.append(amount)
+        for transaction, balance in zip(transactions, balances):
+            transaction.balance = to_decimal(balance)
+            transaction.confirm()
+            transaction.account = self
+            logger.info(f"{self.user.name}: {transaction.description} for {transaction.price}")
+        self.amount = to_decimal(amount)
+        db.session.add_all(transactions)
+        return self.amount
+
     def make_snapshot(self,week):
         snap = self.snapshot_for_week(week)
         user = self.user
@@ -394,6 +523,24 @@ class Account(Base):
     def snapshot_for_week(self,week):
         return next((snap for snap in self.snapshots if snap.week==week), AccountSnapshot())
 
+    @classmethod
+    def valuations(cls):
+        """Returns (account_id, user_id, balance) of all active accounts of active users"""
+        shares_value = db.session.query(Share.user_id, db.func.sum(Share.units * Stock.unit_price).label('value')) \
+            .join(Stock, Stock.id == Share.stock_id) \
+            .group_by(Share.user_id).subquery()
+        return db.session.query(cls.id, cls.user_id, cls.amount + db.func.coalesce(shares_value.c.value, 0)) \
+            .join(User, User.id == cls.user_id) \
+            .outerjoin(shares_value, shares_value.c.user_id == cls.user_id) \
+            .filter(cls.active == True, User.deleted == False).all()
+
+    @classmethod
+    def make_snapshots(cls, week):
+        """Snapshots balances of all active accounts for `week` in one valuation query and one upsert"""
+        rows = [{'account_id': account_id, 'week': week, 'amount': balance} for account_id, user_id, balance in cls.valuations()]
+        AccountSnapshot.upsert(rows, ['account_id', 'week'], ['amount'])
+        return len(rows)
+
 class AccountSnapshot(Base):
     __tablename__ = 'account_snapshots'
     __table_args__ = (db.UniqueConstraint('account_id', 'week'), )
@@ -408,11 +555,16 @@ class Transaction(Base):
 
     date_confirmed = db.Column(db.DateTime,  nullable=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
-    price = db.Column(db.Integer, default=0, nullable=False)
+    # signed settlement amount, negative for sells
+    price = db.Column(db.Numeric(14,7), default=0, nullable=False)
+    # account amount after the transaction, written once by Account.post
+    balance = db.Column(db.Numeric(14,7), nullable=True)
     confirmed = db.Column(db.Boolean, default = False, nullable=False)
     description = db.Column(db.String(255), nullable=False)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'))
 
+    __table_args__ = (db.Index('ix_transactions_account_ledger', account_id, 'id'), )
+
     def confirm(self):
         self.confirmed = True
         self.date_confirmed = datetime.datetime.now()
@@ -426,12 +578,15 @@ class PointCard(Base):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     active = db.Column(db.Boolean, default=True, nullable=False)
     season = db.Column(db.Integer, nullable=False, default=12, index = True)
+    # sum of the records amount, kept in sync by award_points and PointsService
+    points_total = db.Column(db.Integer, nullable=False, default=0, index = True)
 
     records = db.relationship('PointRecord', backref=db.backref('card', lazy=False), cascade="all, delete-orphan",lazy=False)
 
     def __init__(self):
         app = db.get_app()
         self.season = app.config['SEASON']
+        self.points_total = 0
         
 class PointRecord(Base):
     __tablename__ = 'point_records'
@@ -449,6 +604,7 @@ class Position(Base):
 
 class Match(Base):
     __tablename__ = 'matches'
+    __table_args__ = (db.Index('ix_matches_export', 'is_mng', 'round', 'match_uuid'), )
 
     division = db.Column(db.String(255), nullable=False)
     round = db.Column(db.Integer, nullable=False, index=True)
@@ -465,4 +621,20 @@ class Match(Base):
     awayCoachName = db.Column(db.String(255), nullable=True, index=True)
     awayTeamName = db.Column(db.String(255), nullable=False, index=True)
     awayTeamRace = db.Column(db.String(255), nullable=False)
-    awayScore = db.Column(db.Integer, nullable=True)
\ No newline at end of file
+    awayScore = db.Column(db.Integer, nullable=True)
+    # division category precomputed on import so the export can use an index
+    is_mng = db.Column(db.Boolean, nullable=False, default=False)
+
+    @staticmethod
+    def mng_division(division):
+        return "MNG" in (division or "").upper()
+
+class JobStage(Base):
+    __tablename__ = 'job_stages'
+    __table_args__ = (db.UniqueConstraint('job', 'key', 'stage'), )
+    job = db.Column(db.String(80), nullable=False, index=True)
+    # identifies the job run, e.g. season and week for the weekly close
+    key = db.Column(db.String(80), nullable=False)
+    stage = db.Column(db.String(80), nullable=False)
+    # stage duration in seconds
+    duration = db.Column(db.Float, nullable=False, default=0.0)
@@ -0,0 +1,107 @@
+"""DB engine configuration profiles"""
+import copy
+import sqlite3
+
+import sqlalchemy
+from sqlalchemy.engine.url import make_url
+
+from .base_model import db
+
+PROFILES = {
+    # long lived bot process, pooled connections checked before use
+    "bot": {
+        "engine": {
+            "pool_pre_ping": True,
+            "pool_recycle": 3600,
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_timeout": 30,
+        },
+        "batch_size": 100,
+        "statement_cache": 500,
+    },
+    # short lived cron scripts, few connections so they do not starve the bot, big batches
+    "batch": {
+        "engine": {
+            "pool_pre_ping": False,
+            "pool_size": 1,
+            "max_overflow": 2,
+            "pool_timeout": 60,
+        },
+        "batch_size": 1000,
+        "statement_cache": 2000,
+    },
+}
+
+# pool sizing is not supported by the sqlite pools
+POOL_SIZING = ["pool_size", "max_overflow", "pool_timeout", "pool_recycle"]
+
+def sqlite_connection(pragmas):
+    """Returns sqlite3 connection class running `pragmas` on every new connection"""
+    class PragmaConnection(sqlite3.Connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            cursor = self.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+    return PragmaConnection
+
+def profile_options(profile, uri, overrides=None, wal=True, busy_timeout=30):
+    """Returns (engine options, batch size) for `profile` and database `uri`"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB profile {profile}, use one of {', '.join(PROFILES.keys())}")
+    settings = copy.deepcopy(PROFILES[profile])
+    settings["engine"].update((overrides or {}).get("engine", {}))
+    for key in ["batch_size", "statement_cache"]:
+        settings[key] = (overrides or {}).get(key, settings[key])
+
+    options = settings["engine"]
+    # statement caching, native in SQLAlchemy 1.4+, compiled cache on older versions
+    if tuple(int(part) for part in sqlalchemy.__version__.split(".")[:2]) >= (1, 4):
+        options["query_cache_size"] = settings["statement_cache"]
+    else:
+        from sqlalchemy.util import LRUCache
+        options.setdefault("execution_options", {})["compiled_cache"] = LRUCache(settings["statement_cache"])
+
+    if make_url(uri).get_backend_name() == "sqlite":
+        for key in POOL_SIZING:
+            options.pop(key, None)
+        # waits for the lock instead of failing with database is locked
+        pragmas = [f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}"]
+        if wal:
+            # readers do not block the writer and the other way around
+            pragmas.extend(["PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL"])
+        connect_args = options.setdefault("connect_args", {})
+        connect_args["timeout"] = busy_timeout
+        # the PRAGMAs travel with the engine options, each engine gets its own
+        connect_args["factory"] = sqlite_connection(pragmas)
+    return options, settings["batch_size"]
+
+def configure(app, profile):
+    """Sets the engine options of flask `app` for the `profile`"""
+    options, batch_size = profile_options(
+        profile,
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        overrides=app.config.get('DB_PROFILES', {}).get(profile),
+        wal=app.config.get('SQLITE_WAL', True),
+        busy_timeout=app.config.get('SQLITE_BUSY_TIMEOUT', 30),
+    )
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['DB_PROFILE'] = profile
+    app.config['DB_BATCH_SIZE'] = batch_size
+
+def pool_status():
+    """Returns pool metrics of the default engine"""
+    app = db.get_app()
+    pool = db.get_engine().pool
+    status = {
+        "profile": app.config.get('DB_PROFILE'),
+        "pool": type(pool).__name__,
+    }
+    for metric in ["size", "checkedin", "checkedout", "overflow"]:
+        if hasattr(pool, metric):
+            status[metric] = getattr(pool, metric)()
+    status["status"] = pool.status()
+    return status
@@ -0,0 +1,146 @@
+"""Records query shapes seen at runtime and checks them against the table indexes"""
+import atexit
+import json
+import re
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# (table, equality columns, range columns, order by columns): number of executions
+shapes = Counter()
+
+_MAIN_TABLE = re.compile(r'^\s*(?:SELECT\b.*?\bFROM|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.I | re.S)
+_CLAUSE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)', re.I | re.S)
+_ORDER = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)', re.I | re.S)
+_CONDITION = re.compile(r'(?:"?(\w+)"?\.)?"?(\w+)"?\s*(=|!=|<>|<=|>=|<|>|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b)', re.I)
+_COLUMN = re.compile(r'^(?:"?(\w+)"?\.)?"?(\w+)"?(?:\s+(?:ASC|DESC))?$', re.I)
+# operators an index can seek on with the following index column still usable
+_EQUALITY = ["=", "IN", "IS"]
+
+def shape(statement):
+    """Returns {table: (equality columns, range columns, order by columns)} of the SQL `statement`"""
+    main = _MAIN_TABLE.match(statement)
+    if not main:
+        return {}
+    table = main.group(1)
+    # bound parameters and literals are not part of the shape
+    statement = re.sub(r"'[^']*'", "?", statement)
+    result = {}
+
+    def columns(name):
+        return result.setdefault(name or table, (set(), set(), []))
+
+    where = _CLAUSE.search(statement)
+    if where:
+        for qualifier, column, operator in _CONDITION.findall(where.group(1)):
+            if column.upper() in ["AND", "OR", "NOT"] or column.isdigit():
+                continue
+            equality, ranges, _ = columns(qualifier)
+            (equality if operator.upper() in _EQUALITY else ranges).add(column)
+    order = _ORDER.search(statement)
+    if order:
+        for part in order.group(1).split(","):
+            match = _COLUMN.match(part.strip())
+            if match:
+                columns(match.group(1))[2].append(match.group(2))
+    return {
+        name: (tuple(sorted(equality)), tuple(sorted(ranges - equality)), tuple(order_by))
+        for name, (equality, ranges, order_by) in result.items()
+    }
+
+def record(conn, cursor, statement, parameters, context, executemany):
+    for table, (equality, ranges, order_by) in shape(statement).items():
+        shapes[(table, equality, ranges, order_by)] += 1
+
+def load(path):
+    """Returns Counter of the shapes stored in `path`"""
+    stored = Counter()
+    try:
+        with open(path, 'r') as f:
+            for table, equality, ranges, order_by, count in json.load(f):
+                stored[(table, tuple(equality), tuple(ranges), tuple(order_by))] += count
+    except (OSError, ValueError):
+        pass
+    return stored
+
+def save(path):
+    """Adds the shapes recorded by this process to `path`"""
+    stored = load(path)
+    stored.update(shapes)
+    with open(path, 'w') as f:
+        json.dump([[*key, count] for key, count in stored.most_common()], f)
+    shapes.clear()
+
+def enable(path):
+    """Records shapes of all executed statements, they are added to `path` at exit"""
+    if not event.contains(Engine, "before_cursor_execute", record):
+        event.listen(Engine, "before_cursor_execute", record)
+        atexit.register(save, path)
+
+def disable():
+    """Stops recording, the recorded shapes are dropped"""
+    if event.contains(Engine, "before_cursor_execute", record):
+        event.remove(Engine, "before_cursor_execute", record)
+        atexit.unregister(save)
+    shapes.clear()
+
+def coverage(index_columns, equality, ranges, order_by):
+    """Returns number of shape columns the index with `index_columns` can seek or sort on"""
+    used = 0
+    for column in index_columns:
+        if column in equality:
+            used += 1
+            continue
+        if column in ranges:
+            used += 1
+        elif order_by and list(index_columns[used:used + len(order_by)]) == list(order_by):
+            used += len(order_by)
+        break
+    return used
+
+def predicate_columns(index):
+    """Returns columns of the partial `index` condition, reflected by newer SQLAlchemy versions only"""
+    columns = set()
+    for option, value in index.get('dialect_options', {}).items():
+        if option.endswith("_where") and value is not None:
+            columns.update(re.findall(r'\b(\w+)\b\s*(?:=|\bIS\b)', str(value), re.I))
+    return columns
+
+def audit(inspector, stored):
+    """Returns (table, equality, ranges, order by, count, best index, status) for the `stored` shapes
+
+    Status is *covered* when the best index serves all shape columns, *partial* when only some
+    and *missing* when no index starts with a shape column.
+    """
+    indexes = {}
+    report = []
+    for (table, equality, ranges, order_by), count in stored.most_common():
+        if table not in indexes:
+            try:
+                table_indexes = [
+                    (index['name'], index['column_names'], predicate_columns(index)) for index in inspector.get_indexes(table)
+                ]
+                table_indexes.extend(
+                    (constraint['name'] or "unique", constraint['column_names'], set())
+                    for constraint in inspector.get_unique_constraints(table)
+                )
+                table_indexes.append(("primary key", inspector.get_pk_constraint(table)['constrained_columns'], set()))
+            except Exception:
+                table_indexes = None
+            indexes[table] = table_indexes
+        if indexes[table] is None:
+            continue
+        wanted = len(equality) + min(len(ranges), 1) + (len(order_by) if not ranges else 0)
+        if not wanted:
+            continue
+        best, used = None, 0
+        for name, index_columns, predicate in indexes[table]:
+            # columns fixed by the partial index condition need no index column
+            fixed = predicate & set(equality)
+            index_used = len(fixed) + coverage(index_columns, set(equality) - fixed, ranges, order_by)
+            if index_used > used:
+                best, used = f"{name} ({', '.join(index_columns)})", index_used
+        status = "covered" if used >= wanted else "partial" if used else "missing"
+        report.append((table, equality, ranges, order_by, count, best, status))
+    return report
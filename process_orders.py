@@ -1,10 +1,12 @@
 """Updates statistics and process achievements script"""
 import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
 from sqlalchemy import asc
 
 from web import db, app
-from services import AdminNotificationService, OrderService, OrderNotificationService, StockService, UserService
-from models import Order, User
+from services import AdminNotificationService, OrderService, OrderNotificationService, StockService, PointsService, JobRunner
+from models import Order, Account
 from misc.helpers import current_round
 
 
@@ -12,102 +14,74 @@ app.app_context().push()
 
 ROOT = os.path.dirname(__file__)
 
-POINTS = {
-    1: 15,
-    2: 12,
-    3: 10,
-    4: 9,
-    5: 8,
-    6: 7,
-    7: 6,
-    8: 5,
-    9: 4,
-    10: 3,
-    11: 2,
-    12: 2,
-    13: 2,
-    14: 2,
-    15: 2,
-    16: 1,
-    17: 1,
-    18: 1,
-    19: 1,
-    20: 1,
-    21: 1,
-    22: 1,
-    23: 1,
-    24: 1,
-    25: 1,
-}
+JOB = "weekly_close"
+
 # run the application
 def main(argv):
     """main()"""
     try:
-        opts, args = getopt.getopt(argv,"h")
+        opts, args = getopt.getopt(argv,"hr")
     except getopt.GetoptError:
         print('process_orders.py -h')
         sys.exit(2)
+    reset = False
     for opt, arg in opts:
         if opt == '-h':
             print("Process all queued orders")
+            print("  -r  ignore checkpoints of the current week and run all stages again")
             sys.exit(0)
-        
+        if opt == '-r':
+            reset = True
+
+    runner = JobRunner(JOB, f"{app.config['SEASON']}-{current_round()}")
+    if reset:
+        runner.reset()
+
+    def stage(name, desc, func):
+        """runs the `func` as checkpointed stage `name`"""
+        AdminNotificationService.notify(f"{desc} ...")
+        ran, result = runner.run(name, func)
+        if ran:
+            AdminNotificationService.notify(f"Done ({runner.durations[name]:.2f}s)")
+        else:
+            AdminNotificationService.notify("Skipped - already completed")
+        return result
+
     try:
         def chunk_orders(orders):
             group_count = 10
             order_chunks = [orders[i:i+group_count] for i in range(0, len(orders), group_count)]
             for chunk in order_chunks:
-                msg = []
-                for order in chunk:
-                    order = OrderService.process(order)
-                    msg.append(f"{order.user.mention()}: {order.result}")
+                # ledger and order rows of a chunk are committed together
+                msg = [f"{order.user.mention()}: {order.result}" for order in OrderService.process_many(chunk)]
 
                 OrderNotificationService.notify("\n".join(msg))
-            
-        AdminNotificationService.notify("Updating DB ...")
-        StockService.update()
-        AdminNotificationService.notify("Done")
-        AdminNotificationService.notify("Closing market ...")
-        OrderService.close()
-        AdminNotificationService.notify("Done")
-
-        AdminNotificationService.notify("Processing SELL orders...")
-        orders = Order.query.order_by(asc(Order.date_created)).filter(Order.processed == False, Order.operation == "sell").all()
-        chunk_orders(orders)
-        AdminNotificationService.notify("Done")
-
-        AdminNotificationService.notify("Processing BUY orders...")
-        orders = Order.query.order_by(asc(Order.date_created)).filter(Order.processed == False, Order.operation == "buy").all()
-        chunk_orders(orders)
-        AdminNotificationService.notify("Done")
-        
-        AdminNotificationService.notify("Opening market...")
-        OrderService.open()
-        AdminNotificationService.notify("Done")
+
+        # processed orders are flagged so rerun of the stage picks up only the rest
+        def process_orders(operation):
+            orders = Order.query.order_by(asc(Order.date_created)).filter(Order.processed == False, Order.operation == operation).all()
+            chunk_orders(orders)
+
+        def award_points():
+            msg = []
+            for position, value, points, user in PointsService.award_week(current_round()):
+                msg.append(f"{user.mention()}: Awarded {points} points for top {position} gain ({round(value,2)}) in week {current_round()}")
+            return msg
+
+        stage("update", "Updating DB", StockService.update)
+        stage("close", "Closing market", OrderService.close)
+        stage("sell", "Processing SELL orders", lambda: process_orders("sell"))
+        stage("buy", "Processing BUY orders", lambda: process_orders("buy"))
+        stage("open", "Opening market", OrderService.open)
 
         # points and gains only after allowed
         if app.config['ALLOW_TRACKING']:
-            AdminNotificationService.notify("Recording gains...")
-            for user in User.query.all():
-                user.account().make_snapshot(current_round())
-            db.session.commit()
-            AdminNotificationService.notify("Done")
-
-            AdminNotificationService.notify("Recording positions...")
-            sorted_users = UserService.week_gain(current_round(), User.query.count())
-            for i, (position, value, user) in enumerate(sorted_users):
-                user.record_position(position)
-            db.session.commit()
-            AdminNotificationService.notify("Done")
-            
-            AdminNotificationService.notify("Awarding points...")
-            for i, (position, value, user) in enumerate(sorted_users):
-                if position > 25:
-                    break
-                user.award_points(POINTS[position], f"Top {position} gain in week {current_round()}")
-                OrderNotificationService.notify(f"{user.mention()}: Awarded {POINTS[position]} points for top {position} gain ({round(value,2)}) in week {current_round()}")
-            db.session.commit()
-            AdminNotificationService.notify("Done")
+            stage("gains", "Recording gains", lambda: Account.make_snapshots(current_round()))
+            # notifications are sent only after the positions and awards are committed
+            msg = stage("points", "Recording positions and awarding points", award_points) or []
+            group_count = 10
+            for i in range(0, len(msg), group_count):
+                OrderNotificationService.notify("\n".join(msg[i:i+group_count]))
         else:
             AdminNotificationService.notify("Point awards skipped")
 
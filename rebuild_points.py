@@ -0,0 +1,40 @@
+"""Verifies and rebuilds point card totals from the point records"""
+import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
+from web import db, app
+from services import PointsService
+
+app.app_context().push()
+
+ROOT = os.path.dirname(__file__)
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hc")
+    except getopt.GetoptError:
+        print('rebuild_points.py -h')
+        sys.exit(2)
+    check = False
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Rebuild point totals from point records")
+            print("  -c  only check the totals, do not fix them")
+            sys.exit(0)
+        if opt == '-c':
+            check = True
+
+    if check:
+        mismatches = PointsService.verify_totals()
+    else:
+        mismatches = PointsService.rebuild_totals()
+
+    for card, points_total, total in mismatches:
+        print(f"Card {card.id} ({card.user.name}, season {card.season}): total {points_total}, records {total}")
+    print(f"{len(mismatches)} card(s) out of sync" + ("" if check else " fixed"))
+    sys.exit(1 if check and mismatches else 0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
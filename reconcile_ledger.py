@@ -0,0 +1,50 @@
+"""Verifies account amounts against the transaction ledger"""
+import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
+
+from web import db, app
+from services import LedgerService, AdminNotificationService
+
+app.app_context().push()
+
+ROOT = os.path.dirname(__file__)
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hfns:")
+    except getopt.GetoptError:
+        print('reconcile_ledger.py -h')
+        sys.exit(2)
+    season = None
+    full = False
+    notify = False
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Reconcile account amounts with the transaction ledger")
+            print("  -s <season>  season of the accounts, defaults to the current season")
+            print("  -f  replay the full ledger instead of checking the latest balances")
+            print("  -n  notify admins about mismatches")
+            sys.exit(0)
+        if opt == '-s':
+            season = int(arg)
+        if opt == '-f':
+            full = True
+        if opt == '-n':
+            notify = True
+
+    mismatches = LedgerService.reconcile(season, full)
+    for mismatch in mismatches:
+        print(f"account {mismatch['account_id']} (user {mismatch['user_id']}) transaction {mismatch['transaction_id']}: {mismatch['reason']}")
+    accounts = len({mismatch['account_id'] for mismatch in mismatches})
+    print(f"{len(mismatches)} mismatch(es) in {accounts} account(s)")
+
+    if mismatches:
+        if notify:
+            AdminNotificationService.notify(f"Ledger reconciliation found {len(mismatches)} mismatch(es) in {accounts} account(s)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
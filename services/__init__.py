@@ -1,18 +1,42 @@
 """__init__"""
+import importlib
+
 from sqlalchemy import event
 from sqlalchemy.orm.attributes import flag_modified
 
 from models.base_model import db
 from models.data_models import Stock
 
-from .sheet_service import SheetService
 from .stock_service import StockService
+from .price_series import PriceSeries, PricePoint
 from .user_service import UserService
-from .order_service import OrderService, OrderError
+from .points_service import PointsService
+from .order_service import OrderService, OrderError, PositionBook
+from .order_book_service import OrderBookService
 from .notification_service import AdminNotificationService, StockNotificationService, OrderNotificationService
 from .web_hook_service import WebHook
-from .match_service import MatchService
-from .plotting import balance_graph
+from .match_service import MatchService, MatchRecord
+from .job_service import JobRunner
+from .archive_service import ArchiveService, ArchiveError
+from .ledger_service import LedgerService
+
+# services with heavy dependencies, imported on first access
+LAZY_SERVICES = {
+    "SheetService": ".sheet_service",
+    "balance_graph": ".plotting",
+    "stock_chart": ".plotting",
+    "chart_key": ".plotting",
+    "chart_cache": ".plotting",
+    "Analytics": ".analytics",
+    "SimulationService": ".simulation_service",
+}
+
+def __getattr__(name):
+    if name in LAZY_SERVICES:
+        value = getattr(importlib.import_module(LAZY_SERVICES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
@@ -0,0 +1,145 @@
+"""Season analytics on pandas DataFrames"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.data_models import User, Stock, Share, Account, AccountSnapshot, PointCard, StockHistory
+from models.base_model import db
+from misc.cache import TTLCache
+from .price_series import PriceSeries
+
+class SeasonData:
+    """DataFrames of the current season, one bulk read per table"""
+    def __init__(self, users, stocks, prices, holdings, snapshots, points, load_time):
+        self.users = users
+        self.stocks = stocks
+        self.prices = prices
+        self.holdings = holdings
+        self.snapshots = snapshots
+        self.points = points
+        self.load_time = load_time
+
+class Analytics:
+    """Vectorized season statistics, returns are weekly and based on the account snapshots"""
+
+    # season: SeasonData, the frames change with the weekly close, orders only move the holdings
+    cache = TTLCache(maxsize=4, ttl=300)
+
+    @staticmethod
+    def read(query):
+        return pd.read_sql(query.statement, db.session.connection())
+
+    @classmethod
+    def load(cls):
+        """Returns SeasonData of the current season"""
+        app = db.get_app()
+        start = time.perf_counter()
+        users = cls.read(db.session.query(User.id.label('user_id'), User.name).filter(User.deleted == False))
+        stocks = cls.read(db.session.query(Stock.id.label('stock_id'), Stock.code, Stock.name, Stock.division, Stock.unit_price).filter(Stock.deleted == False))
+        prices = cls.read(
+            db.session.query(StockHistory.stock_id, StockHistory.date_created, StockHistory.unit_price)
+            .filter(StockHistory.date_created >= PriceSeries.season_start())
+        )
+        holdings = cls.read(db.session.query(Share.user_id, Share.stock_id, Share.units))
+        snapshots = cls.read(
+            db.session.query(Account.user_id, AccountSnapshot.week, AccountSnapshot.amount)
+            .join(AccountSnapshot, AccountSnapshot.account_id == Account.id)
+            .filter(Account.season == app.config['SEASON'])
+        )
+        points = cls.read(db.session.query(PointCard.user_id, PointCard.points_total).filter(PointCard.season == app.config['SEASON']))
+        for frame, columns in [(stocks, ['unit_price']), (prices, ['unit_price']), (snapshots, ['amount'])]:
+            frame[columns] = frame[columns].astype(float)
+        return SeasonData(users, stocks, prices, holdings, snapshots, points, time.perf_counter() - start)
+
+    @classmethod
+    def cached(cls):
+        """Returns SeasonData of the current season, loaded at most once per cache ttl"""
+        app = db.get_app()
+        data = cls.cache.get(app.config['SEASON'])
+        if data is None:
+            data = cls.load()
+            cls.cache.set(app.config['SEASON'], data)
+        return data
+
+    @staticmethod
+    def balances(data):
+        """Returns week x user_id DataFrame of the snapshot balances"""
+        return data.snapshots.pivot_table(index='week', columns='user_id', values='amount', aggfunc='last').sort_index()
+
+    @classmethod
+    def returns(cls, data):
+        """Returns week x user_id DataFrame of the weekly portfolio returns"""
+        return cls.balances(data).pct_change(fill_method=None).iloc[1:]
+
+    @classmethod
+    def drawdown(cls, data):
+        """Returns Series of the maximal drawdown per user, 0 to -1"""
+        balances = cls.balances(data)
+        return (balances / balances.cummax() - 1).min()
+
+    @classmethod
+    def users(cls, data):
+        """Returns DataFrame of the user statistics ordered by the season return
+
+        Columns: name, balance, return, volatility, drawdown, sharpe, points, invested.
+        """
+        balances = cls.balances(data)
+        returns = balances.pct_change(fill_method=None).iloc[1:]
+        first = balances.bfill().iloc[0] if len(balances) else pd.Series(dtype=float)
+        last = balances.ffill().iloc[-1] if len(balances) else pd.Series(dtype=float)
+        volatility = returns.std()
+        frame = pd.DataFrame({
+            'balance': last,
+            'return': last / first - 1,
+            'volatility': volatility,
+            'drawdown': (balances / balances.cummax() - 1).min(),
+            'sharpe': returns.mean() / volatility.replace(0, np.nan),
+        })
+        frame.index.name = 'user_id'
+
+        holdings = data.holdings.merge(data.stocks[['stock_id', 'unit_price']], on='stock_id')
+        invested = (holdings['units'] * holdings['unit_price']).groupby(holdings['user_id']).sum()
+        frame = frame.join(invested.rename('invested'), how='left') \
+            .join(data.points.set_index('user_id')['points_total'].rename('points'), how='left')
+        frame = data.users.set_index('user_id').join(frame, how='inner')
+        frame[['invested', 'points']] = frame[['invested', 'points']].fillna(0)
+        return frame.sort_values('return', ascending=False)
+
+    @classmethod
+    def stock_changes(cls, data):
+        """Returns DataFrame of the stocks with first, last price and season change"""
+        prices = data.prices.sort_values(['stock_id', 'date_created'])
+        grouped = prices.groupby('stock_id')['unit_price']
+        frame = pd.DataFrame({'first': grouped.first(), 'last': grouped.last()})
+        frame['change'] = frame['last'] / frame['first'].replace(0, np.nan) - 1
+        return data.stocks.set_index('stock_id').join(frame, how='inner')
+
+    @classmethod
+    def divisions(cls, data):
+        """Returns DataFrame of the per division stock performance ordered by the mean change"""
+        changes = cls.stock_changes(data)
+        return changes.groupby('division').agg(
+            stocks=('code', 'count'),
+            mean_change=('change', 'mean'),
+            median_change=('change', 'median'),
+            best=('change', 'max'),
+            worst=('change', 'min'),
+        ).sort_values('mean_change', ascending=False)
+
+    @classmethod
+    def correlations(cls, data, codes=None):
+        """Returns correlation matrix of the daily price returns of the stocks with `codes` (all if None)"""
+        stocks = data.stocks if codes is None else data.stocks[data.stocks['code'].str.lower().isin([code.lower() for code in codes])]
+        prices = data.prices[data.prices['stock_id'].isin(stocks['stock_id'])] \
+            .merge(stocks[['stock_id', 'code']], on='stock_id')
+        daily = prices.set_index('date_created').groupby('code')['unit_price'].resample('D').last().unstack(0).ffill()
+        return daily.pct_change(fill_method=None).corr()
+
+    @classmethod
+    def user_report(cls, data, user_id):
+        """Returns (position, row of Analytics.users) of the user with `user_id` or None"""
+        frame = cls.users(data)
+        if user_id not in frame.index:
+            return None
+        return frame.index.get_loc(user_id) + 1, frame.loc[user_id]
@@ -0,0 +1,134 @@
+"""ArchiveService helpers"""
+from sqlalchemy import func, literal, or_, desc
+
+from models.data_models import Order, Transaction, Account, AccountSnapshot, BalanceHistory, StockHistory, User, Stock
+from models.archive_models import ArchivedOrder, ArchivedTransaction, ArchivedAccountSnapshot, ArchivedBalanceHistory, ArchivedStockHistory
+from models.base_model import db
+
+class ArchiveError(Exception):
+    pass
+
+class ArchiveService:
+    """Moves closed seasons out of the hot tables and reads them back
+
+    Orders, transactions and snapshots are selected by the season of their order or account.
+    Balance and stock histories have no season, rows created before `before`, by default the
+    start of the next season, are archived. The latest history of each stock is kept hot.
+    """
+
+    @classmethod
+    def season_start(cls, season):
+        """Returns creation date of the first account of the `season`"""
+        return db.session.query(func.min(Account.date_created)).filter(Account.season == season).scalar()
+
+    @classmethod
+    def plan(cls, season, before=None):
+        """Returns list of (hot model, archive model, filter) in the order they can be moved"""
+        app = db.get_app()
+        if season >= app.config['SEASON']:
+            raise ArchiveError(f"Season {season} is not closed")
+        before = before or cls.season_start(season + 1)
+        if before is None:
+            raise ArchiveError(f"Season {season + 1} has no accounts, provide the archive date")
+
+        accounts = db.session.query(Account.id).filter(Account.season == season)
+        orders = db.session.query(Order.id).filter(Order.season == season, Order.processed == True)
+        latest_histories = [history_id for history_id, in db.session.query(Stock.latest_history_id).filter(Stock.latest_history_id != None)]
+        return [
+            (Transaction, ArchivedTransaction, or_(Transaction.account_id.in_(accounts), Transaction.order_id.in_(orders))),
+            (Order, ArchivedOrder, Order.id.in_(orders)),
+            (AccountSnapshot, ArchivedAccountSnapshot, AccountSnapshot.account_id.in_(accounts)),
+            (BalanceHistory, ArchivedBalanceHistory, BalanceHistory.date_created < before),
+            (StockHistory, ArchivedStockHistory, db.and_(StockHistory.date_created < before, StockHistory.id.notin_(latest_histories))),
+        ]
+
+    @classmethod
+    def counts(cls, season, before=None):
+        """Returns {table: rows} that archive_season would move"""
+        return {model.__tablename__: model.query.filter(condition).count() for model, _, condition in cls.plan(season, before)}
+
+    @classmethod
+    def archive_season(cls, season, before=None):
+        """Moves the `season` rows to the archive tables in one transaction, returns {table: rows}"""
+        app = db.get_app()
+        batch_size = app.config.get('DB_BATCH_SIZE', 1000)
+        counts = {}
+        try:
+            for model, archive, condition in cls.plan(season, before):
+                columns = [column.name for column in model.__table__.columns]
+                # ids are materialized as MySQL cannot select from the table a DELETE changes
+                ids = [row_id for row_id, in db.session.query(model.id).filter(condition)]
+                for i in range(0, len(ids), batch_size):
+                    chunk = ids[i:i+batch_size]
+                    rows = db.session.query(*model.__table__.columns, literal(season)).filter(model.id.in_(chunk))
+                    db.session.execute(archive.__table__.insert().from_select(columns + ['season'], rows.statement))
+                    db.session.execute(model.__table__.delete().where(model.id.in_(chunk)))
+                counts[model.__tablename__] = len(ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return counts
+
+    @classmethod
+    def seasons(cls):
+        """Returns archived seasons"""
+        return [season for season, in db.session.query(ArchivedOrder.season).distinct().order_by(ArchivedOrder.season)]
+
+    @classmethod
+    def orders(cls, user, season=None):
+        query = ArchivedOrder.query.filter(ArchivedOrder.user_id == user.id)
+        if season is not None:
+            query = query.filter(ArchivedOrder.season == season)
+        return query.order_by(ArchivedOrder.date_created).all()
+
+    @classmethod
+    def transactions(cls, user, season=None):
+        query = ArchivedTransaction.query.join(Account, Account.id == ArchivedTransaction.account_id) \
+            .filter(Account.user_id == user.id)
+        if season is not None:
+            query = query.filter(ArchivedTransaction.season == season)
+        return query.order_by(ArchivedTransaction.date_created).all()
+
+    @classmethod
+    def balance_history(cls, user, season):
+        return ArchivedBalanceHistory.query.filter(ArchivedBalanceHistory.user_id == user.id, ArchivedBalanceHistory.season == season) \
+            .order_by(ArchivedBalanceHistory.date_created).all()
+
+    @classmethod
+    def stock_history(cls, stock, season):
+        return ArchivedStockHistory.query.filter(ArchivedStockHistory.stock_id == stock.id, ArchivedStockHistory.season == season) \
+            .order_by(ArchivedStockHistory.date_created).all()
+
+    @classmethod
+    def final_balances(cls, season, limit=10):
+        """Returns (user, amount) of the last archived snapshot of each `season` account, best first"""
+        last_week = db.session.query(ArchivedAccountSnapshot.account_id, func.max(ArchivedAccountSnapshot.week).label('week')) \
+            .filter(ArchivedAccountSnapshot.season == season) \
+            .group_by(ArchivedAccountSnapshot.account_id).subquery()
+        return db.session.query(User, ArchivedAccountSnapshot.amount) \
+            .join(Account, Account.user_id == User.id) \
+            .join(ArchivedAccountSnapshot, ArchivedAccountSnapshot.account_id == Account.id) \
+            .join(last_week, db.and_(last_week.c.account_id == ArchivedAccountSnapshot.account_id, last_week.c.week == ArchivedAccountSnapshot.week)) \
+            .order_by(desc(ArchivedAccountSnapshot.amount)).limit(limit).all()
+
+    @classmethod
+    def season_stats(cls, season, limit=5):
+        """Returns dict of the `season` order statistics"""
+        successful = db.and_(ArchivedOrder.season == season, ArchivedOrder.success == True)
+        orders, traders = db.session.query(func.count(ArchivedOrder.id), func.count(ArchivedOrder.user_id.distinct())) \
+            .filter(ArchivedOrder.season == season).one()
+        volumes = dict(
+            db.session.query(ArchivedOrder.operation, func.coalesce(func.sum(ArchivedOrder.final_price), 0))
+            .filter(successful).group_by(ArchivedOrder.operation).all()
+        )
+        traded = db.session.query(Stock, func.sum(ArchivedOrder.final_shares).label('shares')) \
+            .join(ArchivedOrder, ArchivedOrder.stock_id == Stock.id) \
+            .filter(successful).group_by(Stock.id).order_by(desc('shares')).limit(limit).all()
+        return {
+            "orders": orders,
+            "traders": traders,
+            "bought": volumes.get("buy", 0),
+            "sold": volumes.get("sell", 0),
+            "most_traded": traded,
+        }
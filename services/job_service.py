@@ -0,0 +1,46 @@
+"""JobService helpers"""
+import time
+
+from models.data_models import JobStage
+from models.base_model import db
+
+class JobRunner:
+    """Runs job stages at most once per job `key` and checkpoints them in the DB"""
+
+    def __init__(self, job, key):
+        self.job = job
+        self.key = str(key)
+        self.durations = {}
+
+    def completed(self):
+        """Returns names of the stages already completed for this job key"""
+        return [stage.stage for stage in JobStage.query.filter_by(job=self.job, key=self.key).all()]
+
+    def is_completed(self, stage):
+        return JobStage.query.filter_by(job=self.job, key=self.key, stage=stage).one_or_none() is not None
+
+    def run(self, stage, func, *args, **kwargs):
+        """Runs `func` unless `stage` is checkpointed already
+
+        The checkpoint is committed together with any changes `func` leaves in the session,
+        so a stage is either fully recorded or rerun. Returns tuple (ran, result).
+        """
+        if self.is_completed(stage):
+            return False, None
+
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            duration = time.perf_counter() - start
+            db.session.add(JobStage(job=self.job, key=self.key, stage=stage, duration=duration))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.durations[stage] = duration
+        return True, result
+
+    def reset(self):
+        """Removes all checkpoints for this job key, next run starts from the beginning"""
+        JobStage.query.filter_by(job=self.job, key=self.key).delete()
+        db.session.commit()
@@ -0,0 +1,89 @@
+"""LedgerService helpers"""
+from sqlalchemy import func
+
+from models.data_models import Account, Transaction
+from models.base_model import db
+from misc.money import to_fixed, to_decimal
+
+class LedgerService:
+    """Reconciles account amounts with the append-only transaction ledger
+
+    Every posted transaction keeps the account amount after it, the latest row is the checkpoint
+    of the account and the chain of rows can be verified from the opening cash alone.
+    """
+
+    @classmethod
+    def accounts(cls, season=None):
+        """Returns (account_id, user_id, amount) of the `season` accounts, current season by default"""
+        app = db.get_app()
+        season = app.config['SEASON'] if season is None else season
+        return db.session.query(Account.id, Account.user_id, Account.amount).filter(Account.season == season).order_by(Account.id).all()
+
+    @classmethod
+    def checkpoints(cls, account_ids):
+        """Returns {account_id: (transaction_id, balance)} of the latest ledger row of the accounts"""
+        app = db.get_app()
+        batch_size = app.config.get('DB_BATCH_SIZE', 1000)
+        checkpoints = {}
+        for i in range(0, len(account_ids), batch_size):
+            latest = db.session.query(func.max(Transaction.id)) \
+                .filter(Transaction.account_id.in_(account_ids[i:i+batch_size]), Transaction.confirmed == True) \
+                .group_by(Transaction.account_id)
+            rows = db.session.query(Transaction.account_id, Transaction.id, Transaction.balance).filter(Transaction.id.in_(latest))
+            checkpoints.update({account_id: (transaction_id, balance) for account_id, transaction_id, balance in rows})
+        return checkpoints
+
+    @classmethod
+    def replay(cls, account_ids):
+        """Returns {account_id: (fixed amount, [(transaction_id, reason)])} replayed from the opening cash"""
+        app = db.get_app()
+        batch_size = app.config.get('DB_BATCH_SIZE', 1000)
+        results = {account_id: (to_fixed(Account.INIT_CASH), []) for account_id in account_ids}
+        for i in range(0, len(account_ids), batch_size):
+            rows = db.session.query(Transaction.account_id, Transaction.id, Transaction.price, Transaction.balance) \
+                .filter(Transaction.account_id.in_(account_ids[i:i+batch_size]), Transaction.confirmed == True) \
+                .order_by(Transaction.account_id, Transaction.id).yield_per(batch_size)
+            for account_id, transaction_id, price, balance in rows:
+                amount, breaks = results[account_id]
+                amount -= to_fixed(price)
+                if balance is None:
+                    breaks.append((transaction_id, "balance missing"))
+                elif to_fixed(balance) != amount:
+                    breaks.append((transaction_id, f"balance {round(balance, 2)} expected {round(to_decimal(amount), 2)}"))
+                    # later rows are checked against the recorded balance, one break is reported once
+                    amount = to_fixed(balance)
+                results[account_id] = (amount, breaks)
+        return results
+
+    @classmethod
+    def reconcile(cls, season=None, full=False):
+        """Returns list of mismatch dicts of the `season` accounts
+
+        Account amounts are compared with the latest ledger balance, `full` replays the whole
+        ledger of every account and reports the rows that break the running balance.
+        """
+        accounts = cls.accounts(season)
+        account_ids = [account_id for account_id, _, _ in accounts]
+        mismatches = []
+        if full:
+            replayed = cls.replay(account_ids)
+            for account_id, user_id, amount in accounts:
+                ledger, breaks = replayed[account_id]
+                for transaction_id, reason in breaks:
+                    mismatches.append({'account_id': account_id, 'user_id': user_id, 'transaction_id': transaction_id, 'reason': reason})
+                if ledger != to_fixed(amount):
+                    mismatches.append({'account_id': account_id, 'user_id': user_id, 'transaction_id': None,
+                        'reason': f"amount {round(amount, 2)} ledger {round(to_decimal(ledger), 2)}"})
+            return mismatches
+
+        checkpoints = cls.checkpoints(account_ids)
+        for account_id, user_id, amount in accounts:
+            transaction_id, balance = checkpoints.get(account_id, (None, to_decimal(to_fixed(Account.INIT_CASH))))
+            if balance is None:
+                reason = "balance missing"
+            elif to_fixed(balance) != to_fixed(amount):
+                reason = f"amount {round(amount, 2)} ledger {round(balance, 2)}"
+            else:
+                continue
+            mismatches.append({'account_id': account_id, 'user_id': user_id, 'transaction_id': transaction_id, 'reason': reason})
+        return mismatches
@@ -1,9 +1,42 @@
 """MatchService helpers"""
 import json
-from sqlalchemy import or_, not_
+from typing import NamedTuple
+from sqlalchemy import or_
 from models.data_models import Stock, Match
 from models.base_model import db
-from .sheet_service import SheetService
+
+class MatchRecord(NamedTuple):
+    """Compact match passed through the collect - import - export pipeline, fields of SheetService.header"""
+    division: str
+    round: int
+    match_uuid: str
+    homeCoachId: int
+    homeCoachName: str
+    homeTeamId: int
+    homeTeamName: str
+    homeTeamRace: str
+    homeScore: int
+    awayCoachId: int
+    awayCoachName: str
+    awayTeamId: int
+    awayTeamName: str
+    awayTeamRace: str
+    awayScore: int
+
+    @classmethod
+    def from_dict(cls, match, round_offset=0):
+        """Creates record from slim round `match` dict, `round_offset` is added to the round"""
+        record = cls(**{field: match.get(field) for field in cls._fields})
+        if round_offset:
+            record = record._replace(round=record.round + round_offset)
+        return record
+
+    @classmethod
+    def from_match(cls, match):
+        return cls(*(getattr(match, field) for field in cls._fields))
+
+    def key(self):
+        return (self.homeTeamName, self.awayTeamName, self.division, self.round)
 
 class MatchService:
     @classmethod
@@ -22,15 +55,53 @@ class MatchService:
 
     @classmethod
     def import_matches(cls, matches):
-        for match in matches:
-            match_instance = Match.query.filter_by(homeTeamName=match['homeTeamName'], awayTeamName=match['awayTeamName'], division=match['division'], round=match['round']).one_or_none()
-            if not match_instance:
-                match_instance = Match(**match)
-                db.session.add(match_instance)
+        """Imports iterable of MatchRecords (or slim round dicts) and commits, returns number of matches
+
+        Matches are identified by home team, away team, division and round. `matches` is read
+        before the DB is touched so the write transaction does not wait on the source.
+        """
+        app = db.get_app()
+        batch_size = app.config.get('DB_BATCH_SIZE', 1000)
+        records = [match if isinstance(match, MatchRecord) else MatchRecord.from_dict(match) for match in matches]
+        if not records:
+            return 0
+        existing = {
+            (home, away, division, round_n): match_id for match_id, home, away, division, round_n in
+            db.session.query(Match.id, Match.homeTeamName, Match.awayTeamName, Match.division, Match.round)
+                .filter(Match.round.in_({record.round for record in records}))
+        }
+        imported = set()
+        inserts = []
+        updates = []
+        count = 0
+
+        def flush():
+            db.session.bulk_insert_mappings(Match, inserts)
+            db.session.bulk_update_mappings(Match, updates)
+            inserts.clear()
+            updates.clear()
+
+        for record in records:
+            key = record.key()
+            if key in imported:
+                continue
+            imported.add(key)
+            mapping = dict(record._asdict(), is_mng=Match.mng_division(record.division))
+            if key in existing:
+                updates.append(dict(mapping, id=existing[key]))
             else:
-                match_instance.update(**match)
+                inserts.append(mapping)
+            count += 1
+            if len(inserts) + len(updates) >= batch_size:
+                flush()
+        flush()
         db.session.commit()
+        return count
 
     @classmethod
-    def played(cls):
-        return Match.query.filter(Match.match_uuid != None, not_(Match.division.ilike('%MNG%'))).all()
\ No newline at end of file
+    def export(cls, rounds, mng=False):
+        """Yields played matches of `rounds` ordered by match uuid, streamed in DB_BATCH_SIZE batches"""
+        app = db.get_app()
+        return Match.query.filter(Match.is_mng == mng, Match.round.in_(rounds), Match.match_uuid != None) \
+            .order_by(Match.match_uuid) \
+            .yield_per(app.config.get('DB_BATCH_SIZE', 1000))
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""OrderBookService helpers"""
+from decimal import Decimal
+
+from sqlalchemy import case, func, and_
+
+from models.data_models import Order, OrderBook, Stock
+from models.base_model import db
+
+class OrderBookService:
+    """Pending buy and sell demand per stock
+
+    OrderBook rows are changed by increments in the transactions that create, cancel or
+    process orders, reads do not touch the orders table.
+    """
+
+    @staticmethod
+    def delta(order):
+        """Returns OrderBook counter increments of the pending `order` (model or query row)"""
+        if order.operation == "buy":
+            return {
+                'buy_orders': 1,
+                'buy_shares': int(str(order.buy_shares)) if order.buy_shares else 0,
+                'buy_funds': Decimal(str(order.buy_funds)) if order.buy_funds else 0,
+                'buy_all': 0 if order.buy_shares or order.buy_funds else 1,
+            }
+        return {
+            'sell_orders': 1,
+            'sell_shares': int(str(order.sell_shares)) if order.sell_shares else 0,
+            'sell_all': 0 if order.sell_shares else 1,
+        }
+
+    @classmethod
+    def apply(cls, orders, sign=1):
+        """Adds (`sign` 1) or removes (`sign` -1) flushed pending `orders` to the books, does not commit"""
+        deltas = {}
+        for order in orders:
+            stock_delta = deltas.setdefault(order.stock_id, {})
+            for column, value in cls.delta(order).items():
+                stock_delta[column] = stock_delta.get(column, 0) + sign * value
+
+        missing = []
+        for stock_id, stock_delta in deltas.items():
+            values = {getattr(OrderBook, column): getattr(OrderBook, column) + value for column, value in stock_delta.items()}
+            updated = OrderBook.query.filter(OrderBook.stock_id == stock_id).update(values, synchronize_session=False)
+            if not updated:
+                missing.append(stock_id)
+        # first order of the stock, the book is built from the orders table
+        if missing:
+            db.session.flush()
+            cls.rebuild(missing)
+
+    @classmethod
+    def aggregate(cls, stock_ids=None):
+        """Returns OrderBook mappings of the pending orders grouped by stock"""
+        is_buy = Order.operation == "buy"
+        is_sell = Order.operation == "sell"
+        query = db.session.query(
+            Order.stock_id,
+            func.sum(case([(is_buy, 1)], else_=0)),
+            func.sum(case([(is_buy, func.coalesce(Order.buy_shares, 0))], else_=0)),
+            func.sum(case([(is_buy, func.coalesce(Order.buy_funds, 0))], else_=0)),
+            func.sum(case([(and_(is_buy, Order.buy_shares == None, Order.buy_funds == None), 1)], else_=0)),
+            func.sum(case([(is_sell, 1)], else_=0)),
+            func.sum(case([(is_sell, func.coalesce(Order.sell_shares, 0))], else_=0)),
+            func.sum(case([(and_(is_sell, Order.sell_shares == None), 1)], else_=0)),
+        ).filter(Order.processed == False)
+        if stock_ids is not None:
+            query = query.filter(Order.stock_id.in_(stock_ids))
+        return [dict(zip(['stock_id'] + OrderBook.COUNTERS, row)) for row in query.group_by(Order.stock_id)]
+
+    @classmethod
+    def rebuild(cls, stock_ids=None):
+        """Recreates books of `stock_ids` (all if None) from the pending orders, does not commit"""
+        query = OrderBook.query
+        if stock_ids is not None:
+            query = query.filter(OrderBook.stock_id.in_(stock_ids))
+        query.delete(synchronize_session=False)
+        rows = cls.aggregate(stock_ids)
+        db.session.bulk_insert_mappings(OrderBook, rows)
+        return len(rows)
+
+    @classmethod
+    def verify(cls):
+        """Returns ids of the stocks whose book does not match the pending orders"""
+        expected = {row['stock_id']: row for row in cls.aggregate()}
+        stored = {book.stock_id: book for book in OrderBook.query.all()}
+        mismatched = []
+        for stock_id in set(expected) | set(stored):
+            row = expected.get(stock_id, {})
+            book = stored.get(stock_id)
+            for column in OrderBook.COUNTERS:
+                if (getattr(book, column) if book else 0) != (row.get(column) or 0):
+                    mismatched.append(stock_id)
+                    break
+        return mismatched
+
+    @classmethod
+    def book(cls, stock):
+        """Returns OrderBook of the `stock`, empty one if there were no orders"""
+        book = OrderBook.query.filter(OrderBook.stock_id == stock.id).one_or_none()
+        if book is None:
+            book = OrderBook(stock_id=stock.id, **{column: 0 for column in OrderBook.COUNTERS})
+        return book
+
+    @classmethod
+    def summary(cls, limit=10):
+        """Returns (totals dict, busiest books) of all pending orders"""
+        totals = db.session.query(*[func.coalesce(func.sum(getattr(OrderBook, column)), 0) for column in OrderBook.COUNTERS]).one()
+        books = OrderBook.query.join(OrderBook.stock) \
+            .filter(OrderBook.buy_orders + OrderBook.sell_orders > 0) \
+            .order_by((OrderBook.buy_orders + OrderBook.sell_orders).desc(), Stock.code) \
+            .limit(limit).all()
+        return dict(zip(OrderBook.COUNTERS, totals)), books
@@ -4,6 +4,8 @@ import os
 
 from models.data_models import Stock, Order, User, Share, Transaction, TransactionError, StockHistory
 from models.base_model import db
+from misc.money import to_fixed, to_decimal, shares_for
+from .order_book_service import OrderBookService
 
 class OrderError(Exception):
     pass
@@ -23,6 +25,84 @@ class Config:
         with open(cls.FILE, 'w') as f:
             json.dump(config, f)
 
+class PositionBook:
+    """Holdings, bank and outstanding orders of one user, loaded once per command
+
+    New orders are validated against the state after the outstanding orders would be
+    processed at the current prices, sells first, then buys, same as OrderService.process.
+    """
+
+    def __init__(self, user, cash, holdings, orders):
+        self.user = user
+        self.cash = cash
+        # stock_id: units
+        self.holdings = holdings
+        self.orders = orders
+
+    @classmethod
+    def load(cls, user):
+        holdings = dict(db.session.query(Share.stock_id, Share.units).filter(Share.user_id == user.id).all())
+        orders = Order.query.filter(Order.user_id == user.id, Order.processed == False).order_by(Order.date_created).all()
+        return cls(user, to_fixed(user.account().amount), holdings, orders)
+
+    def add(self, order):
+        self.orders.append(order)
+
+    def projection(self):
+        """Returns (units after sells, cash after all, units after all) once the outstanding orders are processed"""
+        app = db.get_app()
+        cash = self.cash
+        units = dict(self.holdings)
+        for order in self.orders:
+            if order.operation != "sell":
+                continue
+            held = units.get(order.stock.id, 0)
+            sell_shares = int(order.sell_shares) if order.sell_shares else None
+            sold = sell_shares if sell_shares and sell_shares < held else held
+            units[order.stock.id] = held - sold
+            cash += sold * order.stock.fixed_price
+        after_sells = dict(units)
+
+        for order in self.orders:
+            price = order.stock.fixed_price
+            if order.operation != "buy" or not price:
+                continue
+            funds = cash
+            buy_funds = to_fixed(order.buy_funds) if order.buy_funds else None
+            if buy_funds and buy_funds < funds:
+                funds = buy_funds
+            shares = shares_for(funds, price)
+            buy_shares = int(order.buy_shares) if order.buy_shares else None
+            if buy_shares and shares > buy_shares:
+                shares = buy_shares
+            shares = max(0, min(shares, app.config['MAX_SHARE_UNITS'] - units.get(order.stock.id, 0)))
+            units[order.stock.id] = units.get(order.stock.id, 0) + shares
+            cash -= shares * price
+        return after_sells, cash, units
+
+    def validate(self, stock, operation):
+        """Raises OrderError if order of `operation` on `stock` cannot be fulfilled"""
+        app = db.get_app()
+        after_sells, cash, units = self.projection()
+        if operation in ["sell"]:
+            if not after_sells.get(stock.id, 0):
+                if self.holdings.get(stock.id, 0):
+                    raise OrderError(f"All your shares of {stock.code} are in outstanding sell orders already")
+                raise OrderError(f"You do not own any shares of {stock.code} stock!")
+        if operation in ["buy"]:
+            if self.holdings.get(stock.id, 0) >= app.config['MAX_SHARE_UNITS']:
+                raise OrderError(f"You already own {app.config['MAX_SHARE_UNITS']} shares of {stock.code}")
+            if units.get(stock.id, 0) >= app.config['MAX_SHARE_UNITS']:
+                raise OrderError(f"Your outstanding orders already reach {app.config['MAX_SHARE_UNITS']} shares of {stock.code}")
+            if not stock.unit_price:
+                raise OrderError("Cannot buy stock with 0 price")
+            if cash < stock.fixed_price:
+                raise OrderError(f"Not enough {app.config['CREDITS']} left after outstanding orders to buy a share of {stock.code}")
+
+    def available_units(self, stock):
+        """Returns units of `stock` not covered by outstanding sell orders"""
+        return self.projection()[0].get(stock.id, 0)
+
 class OrderService:
     @classmethod
     def close(cls):
@@ -44,51 +124,105 @@ class OrderService:
         Config.write_config(config)
     
     @classmethod
-    def create(cls, user, stock, **kwargs):
-        app = db.get_app()
+    def create(cls, user, stock, book=None, **kwargs):
+        """Creates order validated against user's PositionBook, `book` is loaded if not provided"""
         if not cls.is_open():
             raise OrderError("Market is closed!!!")
-        
-        if kwargs['operation'] in ["buy"]:
-            share = Share.query.join(Share.user, Share.stock).filter(User.id == user.id, Stock.id == stock.id).one_or_none()
-            if share and share.units >= app.config['MAX_SHARE_UNITS']:
-                raise OrderError(f"You already own {app.config['MAX_SHARE_UNITS']} shares of {stock.code}")
+
+        book = book or PositionBook.load(user)
+        book.validate(stock, kwargs['operation'])
 
         order = Order(**kwargs)
         user.orders.append(order)
         order.stock = stock
+        db.session.flush()
+        OrderBookService.apply([order])
         db.session.commit()
+        book.add(order)
         return order
 
+    @classmethod
+    def create_many(cls, user, specs, book=None):
+        """Creates orders for `specs` list of (stock, order kwargs) in one transaction, returns the orders"""
+        if not cls.is_open():
+            raise OrderError("Market is closed!!!")
+
+        book = book or PositionBook.load(user)
+        outstanding = list(book.orders)
+        orders = []
+        try:
+            for stock, kwargs in specs:
+                # each order is validated with the previous ones already in the book
+                book.validate(stock, kwargs['operation'])
+                order = Order(**kwargs)
+                order.stock = stock
+                orders.append(order)
+                book.add(order)
+            for order in orders:
+                order.user = user
+            db.session.add_all(orders)
+            db.session.flush()
+            OrderBookService.apply(orders)
+            db.session.commit()
+        except Exception:
+            book.orders = outstanding
+            raise
+        return orders
+
+    @classmethod
+    def cancel_many(cls, user):
+        """Cancels all outstanding orders of the user in one statement, returns ids of the cancelled orders"""
+        if not cls.is_open():
+            raise OrderError("Market is closed!!!")
+
+        orders = db.session.query(Order.id, Order.stock_id, Order.operation, Order.buy_shares, Order.buy_funds, Order.sell_shares) \
+            .filter(Order.user_id == user.id, Order.processed == False).all()
+        ids = [order.id for order in orders]
+        if ids:
+            Order.query.filter(Order.id.in_(ids), Order.processed == False).delete(synchronize_session=False)
+            OrderBookService.apply(orders, -1)
+            db.session.commit()
+        return ids
+
     @classmethod
     def cancel(cls, order_id, user):
         if not cls.is_open():
             raise OrderError("Market is closed!!!")
 
-        order = Order.query.join(Order.user).filter(User.id == user.id, Order.processed == False, Order.id == int(order_id)).first()
+        order = Order.query.filter(Order.user_id == user.id, Order.processed == False, Order.id == int(order_id)).first()
 
         if order:
             db.session.delete(order)
+            OrderBookService.apply([order], -1)
             db.session.commit()
             return True
         else:
             return False
     
     @classmethod
-    def process(cls, order):
+    def process(cls, order, commit=True, pending=None):
+        """Processes the `order`, the caller commits if not `commit`
+
+        With `pending` dict the transaction is queued under its account instead of being posted,
+        the dict keeps account: [fixed cash after the queued transactions, transactions].
+        """
         stock_modifier = 1
         app = db.get_app()
+        account = order.user.account()
+        # cash is converted once per account and batch
+        queued = pending.setdefault(account, [to_fixed(account.amount), []]) if pending is not None else [to_fixed(account.amount), []]
         if order.operation == "buy":
             # sets the order stock price at the time of processing
             order.share_price = order.stock.unit_price
-            funds = order.user.account().amount
-            if order.buy_funds and order.buy_funds < funds:
-                funds = order.buy_funds
+            funds = queued[0]
+            if order.buy_funds and to_fixed(order.buy_funds) < funds:
+                funds = to_fixed(order.buy_funds)
+            price = order.stock.fixed_price
             
-            if order.stock.unit_price:
+            if price:
                 share = Share.query.join(Share.user, Share.stock).filter(User.id == order.user.id, Stock.id == order.stock.id).one_or_none()
                 
-                shares = funds // order.stock.unit_price
+                shares = shares_for(funds, price)
                 # if shares limited and they are less than max use them instead
                 if order.buy_shares and shares > order.buy_shares:
                     shares = order.buy_shares
@@ -101,7 +235,8 @@ class OrderService:
                     shares = possible_shares
 
                 order.final_shares = shares
-                order.final_price = shares * order.stock.unit_price
+                settled = shares * price
+                order.final_price = to_decimal(settled)
                 if shares:
                     if share:
                         share.units = Share.units + shares
@@ -113,7 +248,7 @@ class OrderService:
 
                     order.success = True
                     order.result = f"Bought {order.final_shares} {order.stock.code} share(s) for {round(order.final_price, 2)} {app.config['CREDITS']}"
-                    tran = Transaction(order=order, price=order.final_price, description=order.result)
+                    tran = Transaction(order_id=order.id, price=order.final_price, description=order.result)
                 else:
                     order.success = False
                     order.result = f"Not enough funds to buy any shares of {order.stock.code} or {app.config['MAX_SHARE_UNITS']} share limit reached"
@@ -134,10 +269,10 @@ class OrderService:
                     units = order.sell_shares
                     left = True
                 
-                funds = units * order.stock.unit_price
+                settled = -units * order.stock.fixed_price
 
                 order.final_shares = units
-                order.final_price = funds
+                order.final_price = to_decimal(-settled)
 
                 share.units = Share.units - units
                 if not left:
@@ -145,19 +280,65 @@ class OrderService:
 
                 order.success = True
                 order.result = f"Sold {order.final_shares} {order.stock.code} share(s) for {round(order.final_price, 2)} {app.config['CREDITS']}"
-                tran = Transaction(order=order, price=-1*order.final_price, description=order.result)
+                tran = Transaction(order_id=order.id, price=-1*order.final_price, description=order.result)
             else:
                 order.success = False
                 order.result = f"No shares of {order.stock.code} left to sell"
             order.processed = True
         
         if order.success:
-            try:
-                order.user.make_transaction(tran)
-            except TransactionError as exc:
-                order.success = False
-                order.result = str(exc)
+            if pending is None:
+                try:
+                    order.user.make_transaction(tran, commit=False)
+                except TransactionError as exc:
+                    order.success = False
+                    order.result = str(exc)
+            else:
+                queued[0] -= settled
+                queued[1].append(tran)
 
             order.stock.change_units_by(stock_modifier*order.final_shares)
-        db.session.commit()
-        return order
\ No newline at end of file
+        OrderBookService.apply([order], -1)
+        if commit:
+            db.session.commit()
+        return order
+
+    @classmethod
+    def process_many(cls, orders):
+        """Processes `orders` in one transaction, the ledger gets one post per account
+
+        Orders of each account are processed in a savepoint. When the post fails with TransactionError
+        the account's changes are rolled back and its orders are marked failed, the other accounts go on.
+        """
+        by_user = {}
+        for order in orders:
+            by_user.setdefault(order.user_id, []).append(order)
+        try:
+            for user_orders in by_user.values():
+                cls.__process_account(user_orders)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return orders
+
+    @classmethod
+    def __process_account(cls, orders):
+        """Processes `orders` of one account in a savepoint, the caller commits"""
+        pending = {}
+        savepoint = db.session.begin_nested()
+        try:
+            for order in orders:
+                cls.process(order, commit=False, pending=pending)
+            for account, (cash, transactions) in pending.items():
+                if transactions:
+                    account.post(transactions)
+            savepoint.commit()
+        except TransactionError as exc:
+            savepoint.rollback()
+            for order in orders:
+                order.processed = True
+                order.success = False
+                order.result = str(exc)
+            # the books were updated in the savepoint, the failed orders leave them too
+            OrderBookService.apply(orders, -1)
@@ -1,10 +1,29 @@
 import datetime as dt
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+import io
 
+from misc.cache import TTLCache
+
+# (stock id, latest history id) pairs: PNG bytes, a new price makes a new key
+chart_cache = TTLCache(maxsize=64, ttl=24*3600)
+
+
+def pyplot():
+    """Imports matplotlib on first use"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def figure():
+    """Returns new Agg backed figure, it is not registered with pyplot so threads do not share it"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
 
 def balance_graph(users):
+    plt = pyplot()
 
     fig, ax = plt.subplots()
     ax.set_ylabel('balance')
@@ -21,3 +40,37 @@ def balance_graph(users):
     plt.close(fig)
     return True
 
+def chart_key(stocks):
+    """Returns chart cache key of the `stocks`"""
+    return tuple(sorted((stock.id, stock.latest_history_id) for stock in stocks))
+
+def stock_chart(ranges, labels):
+    """Returns PNG bytes of the price chart
+
+    `ranges` is {stock id: (times, prices)} as returned by PriceSeries.ranges, `labels` is
+    {stock id: label}. Series are aligned on the union of their timestamps, prices are held
+    until the next change. Does not touch the DB nor pyplot so it can run in an executor.
+    """
+    import pandas as pd
+
+    series = []
+    for stock_id, (times, prices) in ranges.items():
+        if not times:
+            continue
+        serie = pd.Series(prices, index=pd.DatetimeIndex(times), name=labels[stock_id])
+        # several prices of a stock at one timestamp, the last one wins
+        series.append(serie[~serie.index.duplicated(keep='last')])
+    frame = pd.concat(series, axis=1).sort_index().ffill() if series else pd.DataFrame()
+
+    fig = figure()
+    ax = fig.subplots()
+    ax.set_ylabel('price')
+    ax.set_title('Stock Price History')
+    for column in frame.columns:
+        ax.plot(frame.index, frame[column].to_numpy(), drawstyle='steps-post', label=column)
+    if len(frame.columns):
+        ax.legend()
+    fig.autofmt_xdate()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
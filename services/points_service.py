@@ -0,0 +1,137 @@
+"""PointsService helpers"""
+from sqlalchemy import func, desc
+from sqlalchemy.orm import lazyload
+
+from models.data_models import User, Account, AccountSnapshot, PointCard, PointRecord, Position
+from models.base_model import db
+from misc.helpers import leaderboard
+
+class PointsService:
+    """PointsService helpers namespace"""
+
+    # weekly payout table position: points, overridden by POINTS in the app config
+    POINTS = {
+        1: 15,
+        2: 12,
+        3: 10,
+        4: 9,
+        5: 8,
+        6: 7,
+        7: 6,
+        8: 5,
+        9: 4,
+        10: 3,
+        11: 2,
+        12: 2,
+        13: 2,
+        14: 2,
+        15: 2,
+        16: 1,
+        17: 1,
+        18: 1,
+        19: 1,
+        20: 1,
+        21: 1,
+        22: 1,
+        23: 1,
+        24: 1,
+        25: 1,
+    }
+
+    @classmethod
+    def payout_table(cls):
+        app = db.get_app()
+        table = app.config.get('POINTS', cls.POINTS)
+        return {int(position): int(points) for position, points in table.items()}
+
+    @classmethod
+    def week_gains(cls, week):
+        """Returns leaderboard of all active users by `week` gain, (position, gain, user) tuples"""
+        users = User.query.options(lazyload(User.balance_histories)).all()
+        rows = db.session.query(Account.user_id, AccountSnapshot.week, AccountSnapshot.amount) \
+            .join(AccountSnapshot, AccountSnapshot.account_id == Account.id) \
+            .filter(Account.active == True, AccountSnapshot.week.in_((week, week-1))).all()
+
+        snapshots = {}
+        for user_id, snap_week, amount in rows:
+            snapshots.setdefault(user_id, {})[snap_week] = amount
+
+        user_tuples = []
+        for user in users:
+            snaps = snapshots.get(user.id, {})
+            gain = snaps[week] - snaps[week-1] if len(snaps) == 2 else 0
+            user_tuples.append((gain, user))
+
+        sorted_users = sorted(user_tuples, key=lambda x: x[0], reverse=True)
+        return leaderboard(sorted_users, len(sorted_users))
+
+    @classmethod
+    def award_week(cls, week):
+        """Records positions and awards points for `week` to all users at once
+
+        Returns list of (position, gain, points, user) tuples of the awarded users.
+        Changes are not committed.
+        """
+        app = db.get_app()
+        payout = cls.payout_table()
+        cards = dict(db.session.query(PointCard.user_id, PointCard.id).filter(PointCard.active == True).all())
+
+        positions = []
+        records = []
+        awards = []
+        for position, gain, user in cls.week_gains(week):
+            positions.append({'user_id': user.id, 'position': position, 'week': week, 'season': app.config['SEASON']})
+            points = payout.get(position)
+            if points and user.id in cards:
+                records.append({'card_id': cards[user.id], 'amount': points, 'reason': f"Top {position} gain in week {week}"})
+                awards.append((position, gain, points, user))
+
+        db.session.bulk_insert_mappings(Position, positions)
+        db.session.bulk_insert_mappings(PointRecord, records)
+
+        # one update per distinct payout keeps the totals in the same transaction
+        cards_by_points = {}
+        for position, gain, points, user in awards:
+            cards_by_points.setdefault(points, []).append(cards[user.id])
+        for points, card_ids in cards_by_points.items():
+            PointCard.query.filter(PointCard.id.in_(card_ids)) \
+                .update({PointCard.points_total: PointCard.points_total + points}, synchronize_session=False)
+        return awards
+
+    @classmethod
+    def leaderboard(cls, limit=10, reversed=True):
+        """Returns points leaderboard of active users, (position, points, user) tuples"""
+        query = db.session.query(PointCard.points_total, User) \
+            .join(User, User.id == PointCard.user_id) \
+            .options(lazyload(User.balance_histories)) \
+            .filter(PointCard.active == True, User.deleted == False) \
+            .order_by(desc(PointCard.points_total) if reversed else PointCard.points_total)
+
+        # users tied with the last displayed position are displayed as well
+        cutoff = query.offset(limit-1).limit(1).first()
+        if cutoff:
+            if reversed:
+                query = query.filter(PointCard.points_total >= cutoff[0])
+            else:
+                query = query.filter(PointCard.points_total <= cutoff[0])
+
+        return leaderboard(query.all(), limit)
+
+    @classmethod
+    def verify_totals(cls):
+        """Returns list of (card, points_total, records_total) for cards with total out of sync"""
+        records_total = db.session.query(PointRecord.card_id, func.sum(PointRecord.amount).label('total')) \
+            .group_by(PointRecord.card_id).subquery()
+        total = func.coalesce(records_total.c.total, 0)
+        return db.session.query(PointCard, PointCard.points_total, total) \
+            .outerjoin(records_total, records_total.c.card_id == PointCard.id) \
+            .filter(PointCard.points_total != total).all()
+
+    @classmethod
+    def rebuild_totals(cls):
+        """Resets points_total of all out of sync cards from their records, returns the fixed cards"""
+        mismatches = cls.verify_totals()
+        for card, points_total, total in mismatches:
+            card.points_total = total
+        db.session.commit()
+        return mismatches
@@ -0,0 +1,159 @@
+"""PriceSeries store of the stock histories"""
+import bisect
+import datetime
+from array import array
+from typing import NamedTuple
+
+from sqlalchemy import func
+
+from models.data_models import StockHistory, Account
+from models.base_model import db
+
+class PricePoint(NamedTuple):
+    id: int
+    date_created: datetime.datetime
+    unit_price: float
+    unit_price_change: float
+    units: int
+
+class Series:
+    """Column arrays of the price points of one stock, ordered by the creation date"""
+    def __init__(self):
+        self.ids = array('q')
+        self.times = array('d')
+        self.prices = array('d')
+        self.changes = array('d')
+        self.units = array('q')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def last_id(self):
+        return self.ids[-1] if self.ids else None
+
+    def append(self, history_id, date_created, unit_price, unit_price_change, units):
+        self.ids.append(history_id)
+        self.times.append(date_created.timestamp())
+        self.prices.append(float(unit_price))
+        self.changes.append(float(unit_price_change))
+        self.units.append(units)
+
+    def point(self, i):
+        return PricePoint(
+            self.ids[i], datetime.datetime.fromtimestamp(self.times[i]),
+            self.prices[i], self.changes[i], self.units[i]
+        )
+
+    def slice(self, start=None, end=None):
+        """Returns price points created between `start` and `end` datetimes, both inclusive"""
+        lo = 0 if start is None else bisect.bisect_left(self.times, start.timestamp())
+        hi = len(self.times) if end is None else bisect.bisect_right(self.times, end.timestamp())
+        return [self.point(i) for i in range(lo, hi)]
+
+class PriceSeries:
+    """Current season price series of the stocks, cached in column arrays per process
+
+    The cache of a stock is extended with the histories newer than its last cached point
+    when the stock latest_history_id moves, older points are read from the DB.
+    """
+    _series = {}
+    # (season, start) of the cached series
+    _since = None
+
+    COLUMNS = (StockHistory.id, StockHistory.date_created, StockHistory.unit_price, StockHistory.unit_price_change, StockHistory.units)
+
+    @classmethod
+    def season_start(cls):
+        """Returns creation date of the first account of the current season
+
+        The series are dropped when the season changes. Without any account nothing is cached
+        and all the histories are used until the first account is created.
+        """
+        app = db.get_app()
+        if cls._since is None or cls._since[0] != app.config['SEASON']:
+            since = db.session.query(func.min(Account.date_created)).filter(Account.season == app.config['SEASON']).scalar()
+            if since is None:
+                return datetime.datetime.min
+            cls.clear()
+            cls._since = (app.config['SEASON'], since)
+        return cls._since[1]
+
+    @classmethod
+    def clear(cls):
+        cls._series = {}
+        cls._since = None
+
+    @classmethod
+    def load(cls, stock_ids=None):
+        """Loads the current season series of `stock_ids` (all if None) in one query"""
+        query = db.session.query(StockHistory.stock_id, *cls.COLUMNS).filter(StockHistory.date_created >= cls.season_start())
+        if stock_ids is not None:
+            query = query.filter(StockHistory.stock_id.in_(stock_ids))
+        loaded = {stock_id: Series() for stock_id in (stock_ids or [])}
+        for stock_id, *row in query.order_by(StockHistory.stock_id, StockHistory.date_created, StockHistory.id):
+            loaded.setdefault(stock_id, Series()).append(*row)
+        cls._series.update(loaded)
+        return loaded
+
+    @classmethod
+    def series(cls, stock):
+        """Returns up to date Series of the `stock`"""
+        series = cls._series.get(stock.id)
+        if series is None:
+            return cls.load([stock.id])[stock.id]
+        if stock.latest_history_id is not None and series.last_id() != stock.latest_history_id:
+            query = db.session.query(*cls.COLUMNS).filter(StockHistory.stock_id == stock.id, StockHistory.date_created >= cls.season_start())
+            if len(series):
+                query = query.filter(StockHistory.id > series.last_id())
+            for row in query.order_by(StockHistory.date_created, StockHistory.id):
+                series.append(*row)
+        # units of the latest point change with the trades
+        if len(series) and series.last_id() == stock.latest_history_id:
+            series.units[-1] = stock.last_history().units
+        return series
+
+    @classmethod
+    def last(cls, stock):
+        """Returns the latest PricePoint of the `stock` or None"""
+        history = stock.last_history()
+        if history is None:
+            return None
+        return PricePoint(history.id, history.date_created, float(history.unit_price), float(history.unit_price_change), history.units)
+
+    @classmethod
+    def range(cls, stock, start=None, end=None):
+        """Returns PricePoints of the `stock` created between `start` and `end` datetimes
+
+        The current season is served from the cache, ranges reaching before it are queried.
+        """
+        if start is not None and start >= cls.season_start():
+            return cls.series(stock).slice(start, end)
+        query = db.session.query(*cls.COLUMNS).filter(StockHistory.stock_id == stock.id)
+        if start is not None:
+            query = query.filter(StockHistory.date_created >= start)
+        if end is not None:
+            query = query.filter(StockHistory.date_created <= end)
+        return [
+            PricePoint(history_id, date_created, float(price), float(change), units)
+            for history_id, date_created, price, change, units in query.order_by(StockHistory.date_created, StockHistory.id)
+        ]
+
+    @classmethod
+    def ranges(cls, stocks, start=None, end=None):
+        """Returns {stock id: (times, prices)} lists of the `stocks` in one range query, `start` defaults to the season start"""
+        start = start or cls.season_start()
+        query = db.session.query(StockHistory.stock_id, StockHistory.date_created, StockHistory.unit_price) \
+            .filter(StockHistory.stock_id.in_([stock.id for stock in stocks]), StockHistory.date_created >= start)
+        if end is not None:
+            query = query.filter(StockHistory.date_created <= end)
+        ranges = {stock.id: ([], []) for stock in stocks}
+        for stock_id, date_created, price in query.order_by(StockHistory.stock_id, StockHistory.date_created, StockHistory.id):
+            times, prices = ranges[stock_id]
+            times.append(date_created)
+            prices.append(float(price))
+        return ranges
+
+    @classmethod
+    def current(cls, stock):
+        """Returns PricePoints of the `stock` in the current season"""
+        return cls.series(stock).slice()
@@ -0,0 +1,110 @@
+"""Sheet backends used by the Sheet Service"""
+import os
+import re
+import hashlib
+import json
+
+ROOT = os.path.dirname(__file__)
+
+# use credentials() to create a client to interact with the Google Drive API
+SCOPE = ['https://spreadsheets.google.com/feeds']
+CREDS = None
+
+def credentials():
+    """Loads the service account credentials on first use"""
+    global CREDS
+    if CREDS is None:
+        from oauth2client.service_account import ServiceAccountCredentials
+        CREDS = ServiceAccountCredentials.from_json_keyfile_name(
+            os.path.join(ROOT, '../config/client_secret.json'), SCOPE)
+    return CREDS
+
+def authorize():
+    """Returns authorized gspread client"""
+    import gspread
+    return gspread.authorize(credentials())
+
+class SheetBackend:
+    """Sheet backend interface"""
+
+    # identifies the backend data, used for the local mirror of the written rows
+    name = None
+
+    def get_all_records(self, sheet_name):
+        """Returns rows of `sheet_name` as dicts keyed by the header row"""
+        raise NotImplementedError
+
+    def batch_update(self, sheet_name, data):
+        """Writes `data` list of (row index, rows) tuples to `sheet_name`, row index is 0 based"""
+        raise NotImplementedError
+
+class GoogleSheetBackend(SheetBackend):
+    """Google spreadsheet, keeps one authorized client per process"""
+    _client = None
+    _spreadsheets = {}
+
+    def __init__(self, spreadsheet_id):
+        self.name = spreadsheet_id
+        self.spreadsheet_id = spreadsheet_id
+
+    @classmethod
+    def client(cls):
+        """Returns the authorized client, refreshes the token if it expired"""
+        if cls._client is None:
+            cls._client = authorize()
+        elif credentials().access_token_expired and hasattr(cls._client, 'login'):
+            cls._client.login()
+        return cls._client
+
+    def spreadsheet(self):
+        client = self.__class__.client()
+        if self.spreadsheet_id not in self._spreadsheets:
+            self._spreadsheets[self.spreadsheet_id] = client.open_by_key(self.spreadsheet_id)
+        return self._spreadsheets[self.spreadsheet_id]
+
+    def get_all_records(self, sheet_name):
+        return self.spreadsheet().worksheet(sheet_name).get_all_records()
+
+    def batch_update(self, sheet_name, data):
+        self.spreadsheet().values_batch_update(body={
+            'valueInputOption': 'RAW',
+            'data': [{'range': f"{sheet_name}!A{start+1}", 'values': rows} for start, rows in data]
+        })
+
+class LocalSheetBackend(SheetBackend):
+    """Sheets stored as JSON files of rows in `directory`, first row is the header"""
+
+    def __init__(self, directory):
+        # the import mirror is kept per directory, see SheetService.mirror_file
+        self.name = f"local_{hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:12]}"
+        self.directory = directory
+
+    def sheet_file(self, sheet_name):
+        return os.path.join(self.directory, f"{re.sub('[^a-zA-Z0-9]', '_', sheet_name)}.json")
+
+    def get_values(self, sheet_name):
+        try:
+            with open(self.sheet_file(sheet_name), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def set_values(self, sheet_name, rows):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.sheet_file(sheet_name), 'w') as f:
+            json.dump(rows, f)
+
+    def get_all_records(self, sheet_name):
+        values = self.get_values(sheet_name)
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, row)) for row in values[1:]]
+
+    def batch_update(self, sheet_name, data):
+        values = self.get_values(sheet_name)
+        for start, rows in data:
+            if len(values) < start + len(rows):
+                values.extend([] for i in range(start + len(rows) - len(values)))
+            values[start:start+len(rows)] = [list(row) for row in rows]
+        self.set_values(sheet_name, values)
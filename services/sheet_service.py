@@ -1,14 +1,71 @@
 """Imperiumr Sheet Service helpers"""
 import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import re
+import json
+import itertools
+
+from models.base_model import db
+from .sheet_backends import GoogleSheetBackend, LocalSheetBackend
 
 ROOT = os.path.dirname(__file__)
 
-# use CREDS to create a client to interact with the Google Drive API
-SCOPE = ['https://spreadsheets.google.com/feeds']
-CREDS = ServiceAccountCredentials.from_json_keyfile_name(
-    os.path.join(ROOT, '../config/client_secret.json'), SCOPE)
+class SheetGateway:
+    """Writes rows to sheet backends, keeps a local mirror of the rows written"""
+    MIRROR_DIR = os.path.join(ROOT, '../tmp')
+
+    @classmethod
+    def mirror_file(cls, backend, sheet_name):
+        return os.path.join(cls.MIRROR_DIR, f"{backend.name}_{re.sub('[^a-zA-Z0-9]', '_', sheet_name)}.json")
+
+    @classmethod
+    def load_mirror(cls, backend, sheet_name):
+        try:
+            with open(cls.mirror_file(backend, sheet_name), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def save_mirror(cls, backend, sheet_name, rows):
+        with open(cls.mirror_file(backend, sheet_name), 'w') as f:
+            json.dump(rows, f)
+
+    @classmethod
+    def write_rows(cls, backend, sheet_name, rows, full=False):
+        """Writes `rows` (lists) to `sheet_name` from A1, only rows changed since the last write are sent
+
+        `rows` can be a generator, each row is compared with the mirror as it is read.
+        Returns number of rows sent. `full` ignores the mirror and writes all rows.
+        """
+        mirror = None if full else cls.load_mirror(backend, sheet_name)
+        if mirror is None:
+            mirror = []
+        written = []
+        # (start, end) indexes of the consecutive rows that differ
+        ranges = []
+        start = None
+        for i, row in enumerate(rows):
+            written.append(row)
+            changed = i >= len(mirror) or mirror[i] != row
+            if changed and start is None:
+                start = i
+            elif not changed and start is not None:
+                ranges.append((start, i))
+                start = None
+        # rows no longer exported are blanked
+        if start is None and len(mirror) > len(written):
+            start = len(written)
+        if start is not None:
+            ranges.append((start, max(len(written), len(mirror))))
+
+        data = [
+            (start, written[start:end] + [[""] * len(row) for row in mirror[max(start, len(written)):end]])
+            for start, end in ranges
+        ]
+        if data:
+            backend.batch_update(sheet_name, data)
+        cls.save_mirror(backend, sheet_name, written)
+        return sum(end - start for start, end in ranges)
 
 
 class SheetService:
@@ -21,6 +78,7 @@ class SheetService:
     IMPORT_SHEET="Bot Import"
 
     _stocks = None
+    _backend = None
 
     header = {
         "division":"division",
@@ -40,38 +98,38 @@ class SheetService:
         "awayScore":"awayScore"
     }
 
+    @classmethod
+    def backend(cls):
+        """Returns sheet backend selected by SHEET_BACKEND config, *google* (default) or *local*"""
+        if cls._backend is None:
+            app = db.get_app()
+            if app.config.get('SHEET_BACKEND', "google") == "local":
+                cls._backend = LocalSheetBackend(app.config.get('SHEET_LOCAL_DIR', os.path.join(ROOT, '../tmp/sheets')))
+            else:
+                cls._backend = GoogleSheetBackend(cls.SPREADSHEET_ID)
+        return cls._backend
+
     @classmethod
     def stocks(cls, refresh=False):
         """Returns torunaments from the sheet"""
         if not cls._stocks or refresh:
-            client = gspread.authorize(CREDS)
-            sheet = client.open_by_key(cls.SPREADSHEET_ID).worksheet(cls.MAIN_SHEET)
-            cls._stocks = sheet.get_all_records()
+            cls._stocks = cls.backend().get_all_records(cls.MAIN_SHEET)
         return cls._stocks
 
     @classmethod
-    def update_matches(cls, matches):
-        matches_to_export = [cls.__match_to_dict(match) for match in matches]
-        #insert header
-        matches_to_export.insert(0, cls.header)
-        # turn dict to list
-        matches_to_export = [list(match.values()) for match in matches_to_export]
-
-        client = gspread.authorize(CREDS)
-        sheet = client.open_by_key(cls.SPREADSHEET_ID)
-        sheet.values_update(
-            f'{cls.IMPORT_SHEET}!A1', 
-            params={'valueInputOption': 'RAW'}, 
-            body={'values': matches_to_export}
-        )
+    def update_matches(cls, matches, full=False):
+        """Exports MatchRecords to the import sheet, returns number of rows sent"""
+        rows = itertools.chain([list(cls.header.values())], (cls.__match_to_row(match) for match in matches))
+        return SheetGateway.write_rows(cls.backend(), cls.IMPORT_SHEET, rows, full=full)
 
     @classmethod
-    def __match_to_dict(cls,match):
-        match_d = {}
+    def __match_to_row(cls,match):
+        row = []
         for key in cls.header.keys():
-            match_d[key] = getattr(match, key)
-        match_d["homeTeamName"] = match_d["homeTeamName"].strip()
-        match_d["awayTeamName"] = match_d["awayTeamName"].strip()
-        return match_d
+            value = getattr(match, key)
+            if key in ("homeTeamName", "awayTeamName"):
+                value = value.strip()
+            row.append(value)
+        return row
 
 #if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""SimulationService helpers"""
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy.orm import lazyload
+
+from models.data_models import User, Stock, Share, Order, Account, AccountSnapshot, PointCard
+from models.base_model import db
+from misc.helpers import leaderboard, current_round
+from misc.money import to_fixed, to_decimal, shares_for
+from .points_service import PointsService
+
+class SimulatedUser(NamedTuple):
+    position: int
+    gain: Decimal
+    points: int
+    balance: Decimal
+    cash: Decimal
+    user: User
+
+class SimulationResult(NamedTuple):
+    week: int
+    users: list
+    # operation: [succeeded, failed]
+    orders: dict
+    # stock code: (old price, new price) of the changed stocks
+    price_changes: dict
+    duration: float
+
+class SimulationService:
+    """Dry run of the weekly close, nothing is written to the DB
+
+    Cash, holdings and prices are held in numpy arrays of fixed-point integers indexed by user and stock, pending
+    orders are replayed with OrderService.process semantics, sells first, then buys, both
+    in the order they were placed.
+    """
+
+    @classmethod
+    def sheet_prices(cls):
+        """Returns {stock name: price} of the main sheet, same rows as StockService.update takes"""
+        from .sheet_service import SheetService
+        prices = {}
+        for stock in SheetService.stocks(refresh=True):
+            if not stock['Team(Sorted A-Z)'] or stock['Current Value'] == "#DIV/0!":
+                continue
+            prices[stock['Team(Sorted A-Z)']] = float(stock['Current Value'])
+        return prices
+
+    @classmethod
+    def simulate(cls, new_prices=None, week=None):
+        """Returns SimulationResult of processing the pending orders at `new_prices` {stock name: price}
+
+        Current prices are used for the stocks missing in `new_prices`.
+        """
+        app = db.get_app()
+        start = time.perf_counter()
+        week = week or current_round()
+        max_units = app.config['MAX_SHARE_UNITS']
+
+        stocks = db.session.query(Stock.id, Stock.name, Stock.code, Stock.unit_price).all()
+        stock_index = {stock_id: i for i, (stock_id, _, _, _) in enumerate(stocks)}
+        old_prices = np.array([to_fixed(price) for _, _, _, price in stocks], dtype=np.int64)
+        prices = old_prices.copy()
+        for i, (_, name, _, _) in enumerate(stocks):
+            if new_prices and name in new_prices:
+                prices[i] = to_fixed(new_prices[name])
+
+        users = User.query.options(lazyload(User.balance_histories)).all()
+        user_index = {user.id: i for i, user in enumerate(users)}
+        cash = np.zeros(len(users), dtype=np.int64)
+        has_account = np.zeros(len(users), dtype=bool)
+        for user_id, amount in db.session.query(Account.user_id, Account.amount).filter(Account.active == True):
+            if user_id in user_index:
+                cash[user_index[user_id]] = to_fixed(amount)
+                has_account[user_index[user_id]] = True
+
+        holdings = np.zeros((len(users), len(stocks)), dtype=np.int64)
+        owned = np.zeros((len(users), len(stocks)), dtype=bool)
+        for user_id, stock_id, units in db.session.query(Share.user_id, Share.stock_id, Share.units):
+            if user_id in user_index:
+                holdings[user_index[user_id], stock_index[stock_id]] = units
+                owned[user_index[user_id], stock_index[stock_id]] = True
+
+        orders = db.session.query(Order.user_id, Order.stock_id, Order.operation, Order.buy_funds, Order.buy_shares, Order.sell_shares) \
+            .filter(Order.processed == False).order_by(Order.date_created).all()
+        outcomes = {"sell": [0, 0], "buy": [0, 0]}
+        for operation in ["sell", "buy"]:
+            for user_id, stock_id, order_operation, buy_funds, buy_shares, sell_shares in orders:
+                if order_operation != operation or user_id not in user_index:
+                    continue
+                u, s = user_index[user_id], stock_index[stock_id]
+                price = int(prices[s])
+                success = False
+                if operation == "sell" and owned[u, s]:
+                    units = int(holdings[u, s])
+                    left = False
+                    if sell_shares and sell_shares < units:
+                        units = sell_shares
+                        left = True
+                    holdings[u, s] -= units
+                    owned[u, s] = left
+                    cash[u] += units * price
+                    success = True
+                if operation == "buy" and price:
+                    funds = int(cash[u])
+                    if buy_funds and to_fixed(buy_funds) < funds:
+                        funds = to_fixed(buy_funds)
+                    shares = shares_for(funds, price)
+                    if buy_shares and shares > buy_shares:
+                        shares = buy_shares
+                    possible_shares = max_units - (int(holdings[u, s]) if owned[u, s] else 0)
+                    if possible_shares < shares:
+                        shares = possible_shares
+                    # transactions fail when the price exceeds the bank
+                    if shares and shares * price <= cash[u]:
+                        holdings[u, s] += shares
+                        owned[u, s] = True
+                        cash[u] -= shares * price
+                        success = True
+                outcomes[operation][0 if success else 1] += 1
+
+        balances = cash + holdings @ prices
+        previous = {
+            user_id: to_fixed(amount) for user_id, amount in
+            db.session.query(Account.user_id, AccountSnapshot.amount)
+            .join(AccountSnapshot, AccountSnapshot.account_id == Account.id)
+            .filter(Account.active == True, AccountSnapshot.week == week-1)
+        }
+        gains = []
+        for i, user in enumerate(users):
+            # snapshots are made for active accounts only, same as Account.make_snapshots
+            gain = int(balances[i]) - previous[user.id] if has_account[i] and user.id in previous else 0
+            gains.append((gain, int(balances[i]), int(cash[i]), user))
+
+        payout = PointsService.payout_table()
+        cards = {user_id for user_id, in db.session.query(PointCard.user_id).filter(PointCard.active == True)}
+        ranked = leaderboard(sorted(gains, key=lambda x: x[0], reverse=True), len(gains))
+        result_users = [
+            SimulatedUser(position, to_decimal(gain), payout.get(position, 0) if user.id in cards else 0, to_decimal(balance), to_decimal(user_cash), user)
+            for position, gain, balance, user_cash, user in ranked
+        ]
+        changed = np.nonzero(prices != old_prices)[0]
+        price_changes = {stocks[i][2]: (to_decimal(int(old_prices[i])), to_decimal(int(prices[i]))) for i in changed}
+        return SimulationResult(week, result_users, outcomes, price_changes, time.perf_counter() - start)
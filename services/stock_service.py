@@ -1,17 +1,18 @@
 """StockService helpers"""
 import re
-from decimal import Decimal, getcontext
+from decimal import Decimal
 
 from models.data_models import Stock, Share, User, StockHistory
 from models.base_model import db
+from misc.money import to_fixed, to_decimal
 from .sheet_service import SheetService
+from .price_series import PriceSeries
 
 class StockService:
     non_alphanum_regexp = re.compile('[^a-zA-Z0-9]')
     division_replace_regexp = re.compile('(Season \d+\s*(-|–|\s*)\s*Division\s+)|(#N\/A)')
     @classmethod
     def update(cls):
-        getcontext().prec = 14
         stocks = SheetService.stocks(refresh=True)
         for stock in stocks:
             if not stock['Team(Sorted A-Z)'] or stock['Current Value']=="#DIV/0!":
@@ -19,18 +20,19 @@ class StockService:
             st = stock['Team(Sorted A-Z)']
             db_stock = Stock.query.with_deleted().filter_by(name=st).one_or_none()
             new_history = True
+            # prices are rounded half even to the 7 places of the column before any arithmetic
+            unit_price = to_decimal(to_fixed(stock['Current Value']))
             if not db_stock:
                 db_stock = Stock()
-                db_stock.unit_price = Decimal(stock['Current Value'])
+                db_stock.unit_price = unit_price
                 change = 0
                 db.session.add(db_stock)
             else:
-                if round(db_stock.unit_price,2) == round(Decimal(stock['Current Value']),2):
+                if round(db_stock.unit_price,2) == round(unit_price,2):
                     change = db_stock.unit_price_change
                     new_history = False
                 else:
-                    change = Decimal(stock['Current Value']) - Decimal(db_stock.unit_price)
-            unit_price = round(Decimal(stock['Current Value']), 7)
+                    change = to_decimal(to_fixed(unit_price) - to_fixed(db_stock.unit_price))
             stock_dict = {
                 'name': stock['Team(Sorted A-Z)'],
                 'unit_price': unit_price,
@@ -49,8 +51,9 @@ class StockService:
                     sh = StockHistory(unit_price=db_stock.unit_price, unit_price_change=db_stock.unit_price_change, units=last_history.units)
                 else:
                     sh = StockHistory(unit_price=db_stock.unit_price, unit_price_change=0, units=0)
-                db_stock.histories.append(sh)
+                db_stock.add_history(sh)
         db.session.commit()
+        PriceSeries.clear()
 
     @classmethod
     def add(cls, user, stock, shares):
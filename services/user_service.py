@@ -6,6 +6,7 @@ from models.data_models import User, Transaction
 from models.base_model import db
 
 from misc.helpers import leaderboard
+from .points_service import PointsService
 
 class UserService:
     """UserService helpers namespace"""
@@ -17,7 +18,7 @@ class UserService:
 
     @staticmethod
     def order_by_points(limit=10,reversed=True):
-        return UserService.__order("points",limit=limit,reversed=reversed)
+        return PointsService.leaderboard(limit=limit,reversed=reversed)
     
     @staticmethod
     def order_by_balance(limit=10,reversed=True):
@@ -44,15 +45,4 @@ class UserService:
 
     @staticmethod
     def week_gain(week,limit=10):
-
-        users = User.query.all()
-
-        user_tuples = []
-        for user in users:
-            user_tuples.append((user.week_gain(week), user))
-
-        sorted_users = sorted(user_tuples, key=lambda x: x[0], reverse=True)
-
-        sorted_users = leaderboard(sorted_users,limit)
-
-        return sorted_users
\ No newline at end of file
+        return [row for row in PointsService.week_gains(week) if row[0] <= limit]
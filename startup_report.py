@@ -0,0 +1,67 @@
+"""Reports import time of the entry points, python -X importtime style"""
+import os, sys, getopt
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# modules imported at the start of each entry point
+ENTRY_POINTS = {
+    "bot": ["discord", "web", "services", "models.data_models", "misc.helpers"],
+    "update_matches": ["update_matches"],
+    "process_orders": ["process_orders"],
+    "close_market": ["close_market"],
+    "rebuild_points": ["rebuild_points"],
+}
+
+def import_times(modules):
+    """Imports `modules` in a fresh interpreter, returns (total_us, [(cumulative_us, self_us, module)])"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().split("\n")[-1])
+
+    total = 0
+    times = []
+    for line in proc.stderr.split("\n"):
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # top level imports are not indented
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us)
+        times.append((int(cumulative_us), int(self_us), name.strip()))
+    return total, times
+
+# run the application
+def main(argv):
+    """main()"""
+    try:
+        opts, args = getopt.getopt(argv,"hn:")
+    except getopt.GetoptError:
+        print('startup_report.py -h')
+        sys.exit(2)
+    top = 10
+    for opt, arg in opts:
+        if opt == '-h':
+            print("Report startup import time of the entry points")
+            print("startup_report.py [-n <count>] [entry_point ...]")
+            print(f"  entry points: {', '.join(ENTRY_POINTS.keys())}")
+            print("  -n  number of the slowest imports to list, default 10")
+            sys.exit(0)
+        if opt == '-n':
+            top = int(arg)
+
+    for entry in args or ENTRY_POINTS.keys():
+        try:
+            total, times = import_times(ENTRY_POINTS[entry])
+        except (KeyError, RuntimeError) as exc:
+            print(f"{entry}: failed - {exc}")
+            continue
+        print(f"{entry}: {total/1000:.1f} ms")
+        for cumulative_us, self_us, name in sorted(times, reverse=True)[:top]:
+            print("  {:>10.1f} ms {:>10.1f} ms  {}".format(cumulative_us/1000, self_us/1000, name))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
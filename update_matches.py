@@ -1,5 +1,7 @@
 """Updates statistics and process achievements script"""
 import os, sys, getopt
+# cron scripts use the batch DB profile
+os.environ.setdefault("DB_PROFILE", "batch")
 import json
 import logging
 from logging.handlers import RotatingFileHandler
@@ -7,7 +9,7 @@ import datetime as DT
 
 import bb2
 from web import db, app
-from services import SheetService, StockService, AdminNotificationService, MatchService
+from services import SheetService, StockService, AdminNotificationService, MatchService, MatchRecord
 
 app.app_context().push()
 
@@ -17,16 +19,25 @@ ROOT = os.path.dirname(__file__)
 def main(argv):
     """main()"""
     try:
-        opts, args = getopt.getopt(argv,"h")
+        opts, args = getopt.getopt(argv,"hfR:P:")
     except getopt.GetoptError:
         print('update_matches.py -h')
         sys.exit(2)
     refresh = False
+    http = None
     for opt, arg in opts:
         if opt == '-h':
-            refresh = True
             print("Download all matches for rounds")
+            print("  -f  rewrite the whole import sheet instead of the changed rows")
+            print("  -R <dir>  record the API responses to fixtures in <dir>")
+            print("  -P <dir>  replay the API responses from fixtures in <dir>, no network access")
             sys.exit(0)
+        if opt == '-f':
+            refresh = True
+        if opt == '-R':
+            http = bb2.Recorder(arg, mode="record")
+        if opt == '-P':
+            http = bb2.Recorder(arg, mode="replay")
         
     logger = logging.getLogger('collector')
     logger.setLevel(logging.INFO)
@@ -37,7 +48,7 @@ def main(argv):
     handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
     logger.addHandler(handler)
 
-    agent = bb2.REBBL_API()
+    agent = bb2.REBBL_API(base_url=app.config.get('REBBL_API_URL'), http=http)
     
     
     leagues = app.config['LEAGUES']
@@ -48,41 +59,40 @@ def main(argv):
     leagues_po = app.config['LEAGUES_PO']
     rounds_po = app.config['ROUNDS_COLLECT_PO']
     
-    matches = []
-    try:
+    def collect():
+        """yields (league, round, round offset) of all collected rounds, playoff rounds follow the regular season"""
         for league in leagues:
             for round in rounds:
-                data = agent.slim_round(league,season,round)
-                matches.extend(data)
+                yield league, round, 0
 
         for league in leagues_po:
             for round in rounds_po:
-                data = agent.slim_round(league,season,round)
-                for match in data:
-                    match["round"]+=13
-                matches.extend(data)
+                yield league, round, 13
+
+    # each round is read from the API first and committed in its own short transaction
+    count = 0
+    try:
+        for league, round, round_offset in collect():
+            count += MatchService.import_matches(
+                MatchRecord.from_dict(match, round_offset=round_offset) for match in agent.slim_round_stream(league,season,round)
+            )
     except Exception as exc:
         logger.error(exc)
         AdminNotificationService.notify(str(exc))
         raise exc
 
-    logger.info("Matches colleted")
-    MatchService.import_matches(matches)
-    logger.info("Matches stored")
-    # filter out unplayed and not in export rounds
-    matches_to_export = MatchService.played()
-    matches_to_export = [match for match in matches_to_export if match.round in rounds_export]
-    #sort by match uuid and in round
-    matches_to_export = sorted(matches_to_export, key=lambda x: x.match_uuid)
+    logger.info(f"Matches colleted and stored ({count})")
+    # played matches of the export rounds sorted by match uuid
+    matches_to_export = (MatchRecord.from_match(match) for match in MatchService.export(rounds_export))
 
     try:
-        SheetService.update_matches(matches_to_export)
+        rows = SheetService.update_matches(matches_to_export, full=refresh)
     except Exception as exc:
         logger.error(exc)
         AdminNotificationService.notify(str(exc))
         raise exc
 
-    logger.info("Matches exported to sheet")
+    logger.info(f"Matches exported to sheet, {rows} rows sent")
 
     try:
         StockService.update()
@@ -8,17 +8,25 @@ from flask_migrate import Migrate
 from sqlalchemy.orm import raiseload
 
 from models.base_model import db
+from models import engine, index_audit
 from services import AdminNotificationService, WebHook, StockNotificationService, OrderNotificationService
 
 os.environ["YOURAPPLICATION_SETTINGS"] = "config/config.py"
 ROOT = os.path.dirname(__file__)
 
-def create_app():
-    """return initialized flask app"""
+def create_app(profile=None):
+    """return initialized flask app
+
+    `profile` selects the DB engine profile, *bot* or *batch*, defaults to DB_PROFILE env variable
+    """
     fapp = Flask(__name__)
     fapp.config["DEBUG"] = True
     fapp.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     fapp.config.from_envvar('YOURAPPLICATION_SETTINGS')
+    engine.configure(fapp, profile or os.environ.get("DB_PROFILE") or fapp.config.get('DB_PROFILE', "bot"))
+    if fapp.config.get('DB_INDEX_AUDIT'):
+        # query shapes are collected for index_audit.py
+        index_audit.enable(fapp.config['DB_INDEX_AUDIT'])
     db.init_app(fapp)
     
     AdminNotificationService.register_notifier(